@@ -0,0 +1,193 @@
+'''
+Parallel position analysis on a pool of worker processes.
+
+Jobs carry the position as a FEN string (plus a 16 bit move code for root move jobs),
+every worker rebuilds its own GameState from it. Results are yielded as soon as they
+finish, jobs can have a time limit and each job, queued or running, can be cancelled.
+
+    with AnalysisPool() as pool:
+        for result in pool.run(rootMoveJobs(gs, "search", timeLimit = 2.0)):
+            print(result.job.move, result.value)
+'''
+import concurrent.futures
+import multiprocessing
+import time
+from collections import namedtuple
+
+import ChessEngine
+import Search
+
+# kind is "search" or "perft", move is a move code made before the job runs (root splitting)
+Job = namedtuple("Job", ["kind", "fen", "move", "depth", "timeLimit", "nodeLimit"])
+Job.__new__.__defaults__ = (None, None, None, None)
+
+# status is "ok", "timeout", "cancelled" or "error"
+# value is the leaf count for perft and (best move code, score, pv codes) for search
+JobResult = namedtuple("JobResult", ["jobId", "job", "status", "value", "nodes", "seconds"])
+
+perftCheckEvery = 4096 # nodes between clock and cancel checks
+
+class JobStopped(Exception):
+    pass
+
+
+# worker process state, set by the pool initializer
+_cancelled = None
+_searcher = None
+
+def _initWorker(cancelled, ttSizeMB):
+    global _cancelled, _searcher
+    _cancelled = cancelled
+    _searcher = Search.Searcher(ttSizeMB)
+
+# one job's cancel flag in the pool's shared set of cancelled jobIds, used as the search's stopEvent
+class JobStopEvent():
+    def __init__(self, cancelled, jobId):
+        self.cancelled = cancelled
+        self.jobId = jobId
+
+    def is_set(self):
+        return self.jobId in self.cancelled
+
+def _runJob(jobId, job):
+    start = time.perf_counter()
+    stopEvent = JobStopEvent(_cancelled, jobId)
+    if stopEvent.is_set():
+        return JobResult(jobId, job, "cancelled", None, 0, 0.0)
+    gs = ChessEngine.GameState.fromFEN(job.fen)
+    if job.move is not None:
+        gs.makeMoveCode(job.move)
+    try:
+        if job.kind == "perft":
+            deadline = start + job.timeLimit if job.timeLimit is not None else None
+            counter = [0]
+            leaves = stoppablePerft(gs, job.depth, deadline, counter, stopEvent)
+            return JobResult(jobId, job, "ok", leaves, counter[0], time.perf_counter() - start)
+        if job.kind == "search":
+            result = _searcher.search(gs, maxDepth = job.depth or Search.maxPly, timeLimit = job.timeLimit,
+                nodeLimit = job.nodeLimit, stopEvent = stopEvent)
+            status = "cancelled" if stopEvent.is_set() else "ok"
+            best = result.bestMove.moveId if result.bestMove is not None else None
+            value = (best, result.score, [move.moveId for move in result.pv])
+            return JobResult(jobId, job, status, value, result.nodes, time.perf_counter() - start)
+        raise ValueError("unknown job kind: " + job.kind)
+    except JobStopped as stopped:
+        return JobResult(jobId, job, str(stopped), None, 0, time.perf_counter() - start)
+    except Exception as error:
+        return JobResult(jobId, job, "error", repr(error), 0, time.perf_counter() - start)
+
+'''
+Perft that gives up with JobStopped when the deadline passes or stopEvent is set.
+counter[0] counts the interior nodes visited.
+'''
+def stoppablePerft(gs, depth, deadline, counter, stopEvent = None):
+    if depth == 0:
+        return 1
+    counter[0] += 1
+    if counter[0] % perftCheckEvery == 0:
+        if stopEvent is not None and stopEvent.is_set():
+            raise JobStopped("cancelled")
+        if deadline is not None and time.perf_counter() > deadline:
+            raise JobStopped("timeout")
+    moves = gs.getValidMoveCodes()
+    if depth == 1:
+        return len(moves)
+    leaves = 0
+    for move in moves:
+        gs.makeMoveCode(move)
+        leaves += stoppablePerft(gs, depth - 1, deadline, counter, stopEvent)
+        gs.undoMove()
+    return leaves
+
+
+class AnalysisPool():
+    def __init__(self, processes = None, ttSizeMB = 16):
+        self.manager = multiprocessing.Manager()
+        self.cancelled = self.manager.dict() # jobId -> True, read by the workers
+        self.executor = concurrent.futures.ProcessPoolExecutor(processes, initializer = _initWorker,
+            initargs = (self.cancelled, ttSizeMB))
+        self.nextJobId = 0
+        self.futures = {} # jobId -> future, not finished yet
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait = True, cancel_futures = True)
+        self.manager.shutdown()
+
+    '''
+    Queues one job and returns its future, future.jobId is the id to pass to cancel().
+    '''
+    def submit(self, job):
+        jobId = self.nextJobId
+        self.nextJobId += 1
+        future = self.executor.submit(_runJob, jobId, job)
+        future.jobId = jobId
+        self.futures[jobId] = future
+        future.add_done_callback(lambda future: self.futures.pop(future.jobId, None))
+        return future
+
+    '''
+    Runs the jobs and yields a JobResult for each one in the order they finish.
+    jobIds follow the order of jobs. timeout (seconds, for the whole batch) cancels
+    whatever is left of the batch when it runs out, those jobs are reported as "cancelled".
+    '''
+    def run(self, jobs, timeout = None):
+        futures = {}
+        for job in jobs:
+            future = self.submit(job)
+            futures[future] = (self.nextJobId - 1, job)
+        done = set()
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout = timeout):
+                done.add(future)
+                yield self.resultOf(future, *futures[future])
+        except concurrent.futures.TimeoutError:
+            for future, (jobId, job) in futures.items():
+                if future not in done:
+                    self.cancel(jobId)
+            for future, (jobId, job) in futures.items():
+                if future not in done:
+                    yield self.resultOf(future, jobId, job)
+
+    @staticmethod
+    def resultOf(future, jobId, job):
+        if future.cancelled():
+            return JobResult(jobId, job, "cancelled", None, 0, 0.0)
+        return future.result()
+
+    # one job (all unfinished ones without jobId), a pending job is dropped, a running one stops at its next check
+    def cancel(self, jobId = None):
+        jobIds = list(self.futures) if jobId is None else [jobId]
+        for jobId in jobIds:
+            self.cancelled[jobId] = True
+            future = self.futures.get(jobId)
+            if future is not None:
+                future.cancel()
+
+    '''
+    Perft of gs split over its root moves, returns (leaves, {move notation: leaves}).
+    '''
+    def perft(self, gs, depth):
+        moves = {move.moveId: move.getChessNotation() for move in gs.getValidMoves()}
+        if depth <= 1:
+            return len(moves), {notation: 1 for notation in moves.values()}
+        counts = {}
+        for result in self.run(rootMoveJobs(gs, "perft", depth = depth - 1)):
+            if result.status != "ok":
+                raise RuntimeError("perft job %s: %s" % (result.status, result.value))
+            counts[moves[result.job.move]] = result.value
+        return sum(counts.values()), counts
+
+
+# one job per legal root move of gs, the job's score is from the opponent's point of view
+def rootMoveJobs(gs, kind, depth = None, timeLimit = None, nodeLimit = None):
+    fen = gs.toFEN()
+    return [Job(kind, fen, move, depth, timeLimit, nodeLimit) for move in gs.getValidMoveCodes()]
+
+def positionJobs(fens, kind, depth = None, timeLimit = None, nodeLimit = None):
+    return [Job(kind, fen, None, depth, timeLimit, nodeLimit) for fen in fens]
@@ -0,0 +1,206 @@
+'''
+Move generation for many independent positions at once with NumPy.
+
+Positions are an N x 64 array of piece codes (0 empty, 1 + Zobrist.pieces index otherwise,
+squares row*8 + col like the bitboards) plus side to move, en passant square and castling
+rights per position. generate() computes, with array operations over all N positions:
+
+    attacks      N x 2 uint64, squares attacked by white and by black
+    moveMasks    N x 64 uint64, pseudo-legal targets of the side to move's piece on each square
+    moveCounts   N, pseudo-legal move count (a promotion counts four times)
+    inCheck      N bool, the side to move is in check
+
+The masks hold the same moves as GameState.getAllPossibleMoveCodes. Legality (pins, king
+safety) is left to the per-position fallback: gameState(batch, i).getValidMoves(),
+crossCheck compares one position of a batch against it.
+
+    batch = encode(gameStates)
+    moves = generate(batch)
+'''
+from collections import namedtuple
+
+import numpy as np
+
+import Bitboard
+import ChessEngine
+import Zobrist
+
+pieceNames = ["--"] + Zobrist.pieces # piece code -> "wp", "bK", ...
+pieceCodes = {name: code for code, name in enumerate(pieceNames)}
+
+# pieces N x 64 int8, whiteToMove N bool, enpassant N int8 (-1 if none), castling N uint8 (rights bits)
+Batch = namedtuple("Batch", ["pieces", "whiteToMove", "enpassant", "castling"])
+BatchMoves = namedtuple("BatchMoves", ["attacks", "moveMasks", "moveCounts", "inCheck"])
+
+_squareBits = np.uint64(1) << np.arange(64, dtype = np.uint64)
+_knightTable = np.array(Bitboard.knightAttacks, dtype = np.uint64)
+_kingTable = np.array(Bitboard.kingAttacks, dtype = np.uint64)
+_pawnTables = {color: np.array(Bitboard.pawnAttacks[color], dtype = np.uint64) for color in "wb"}
+_notFileA = np.uint64(Bitboard.full & ~sum(1 << (row*8) for row in range(8)))
+_notFileH = np.uint64(Bitboard.full & ~sum(1 << (row*8 + 7) for row in range(8)))
+_full = np.uint64(Bitboard.full)
+_rows = np.arange(64) >> 3
+
+# (shift, left, wrap mask) for each sliding direction, row 0 is rank 8 so north shifts right
+_rookShifts = ((8, False, _full), (8, True, _full), (1, True, _notFileA), (1, False, _notFileH))
+_bishopShifts = ((7, False, _notFileA), (9, False, _notFileH), (9, True, _notFileA), (7, True, _notFileH))
+
+
+def encode(gameStates):
+    gameStates = list(gameStates)
+    n = len(gameStates)
+    pieces = np.zeros((n, 64), dtype = np.int8)
+    whiteToMove = np.zeros(n, dtype = bool)
+    enpassant = np.full(n, -1, dtype = np.int8)
+    castling = np.zeros(n, dtype = np.uint8)
+    for i, gs in enumerate(gameStates):
+        pieces[i] = [pieceCodes[piece] for row in gs.board for piece in row]
+        whiteToMove[i] = gs.whiteToMove
+        if gs.enpassantPossible:
+            enpassant[i] = Bitboard.square(*gs.enpassantPossible)
+        castling[i] = gs.castlingRights
+    return Batch(pieces, whiteToMove, enpassant, castling)
+
+# N x 12 x 64 bool planes in Zobrist.pieces order
+def toPlanes(pieces):
+    return pieces[:, None, :] == np.arange(1, 13, dtype = np.int8)[None, :, None]
+
+def fromPlanes(planes, whiteToMove, enpassant = None, castling = None):
+    n = len(planes)
+    pieces = (planes * np.arange(1, 13, dtype = np.int8)[None, :, None]).sum(axis = 1).astype(np.int8)
+    if enpassant is None:
+        enpassant = np.full(n, -1, dtype = np.int8)
+    if castling is None:
+        castling = np.zeros(n, dtype = np.uint8)
+    return Batch(pieces, np.asarray(whiteToMove, dtype = bool), enpassant, castling)
+
+# per-position fallback: the GameState of position i
+def gameState(batch, i):
+    gs = ChessEngine.GameState()
+    gs.board = [[pieceNames[code] for code in batch.pieces[i, row*8:row*8 + 8]] for row in range(8)]
+    fen = gs.toFEN().split()[0]
+    castling = "".join(letter for bit, letter in enumerate(ChessEngine.castlingLetters) if batch.castling[i] & (1 << bit)) or "-"
+    ep = batch.enpassant[i]
+    enpassant = ChessEngine.Move.colsToFiles[ep & 7] + ChessEngine.Move.rowsToRanks[ep >> 3] if ep >= 0 else "-"
+    return ChessEngine.GameState.fromFEN("%s %s %s %s 0 1" % (fen, "w" if batch.whiteToMove[i] else "b", castling, enpassant))
+
+
+def _shift(bb, amount, left):
+    return bb << np.uint64(amount) if left else bb >> np.uint64(amount)
+
+# Kogge-Stone fill of every generator bit along one direction, stopping at (and including) blockers
+def _slide(generators, empty, amount, left, mask):
+    empty = empty & mask
+    generators = generators | (empty & _shift(generators, amount, left))
+    empty = empty & _shift(empty, amount, left)
+    generators = generators | (empty & _shift(generators, 2 * amount, left))
+    empty = empty & _shift(empty, 2 * amount, left)
+    generators = generators | (empty & _shift(generators, 4 * amount, left))
+    return _shift(generators, amount, left) & mask
+
+# attacks of the sliders marked in isSlider (N x 64), only the squares holding one are filled
+def _sliderAttacks(isSlider, empty, shifts):
+    positions, squares = np.nonzero(isSlider)
+    origins = _squareBits[squares]
+    empty = empty[positions]
+    attacks = np.zeros_like(origins)
+    for amount, left, mask in shifts:
+        attacks |= _slide(origins, empty, amount, left, mask)
+    result = np.zeros(isSlider.shape, dtype = np.uint64)
+    result[positions, squares] = attacks
+    return result
+
+def _orReduce(values, axis):
+    return np.bitwise_or.reduce(values, axis = axis)
+
+
+'''
+Attack maps, pseudo-legal move masks, move counts and check flags of every position in batch.
+'''
+def generate(batch):
+    pieces = batch.pieces
+    n = len(pieces)
+    bits = np.where(pieces > 0, _squareBits[None, :], np.uint64(0))
+    isWhite = (pieces >= 1) & (pieces <= 6)
+    isBlack = pieces >= 7
+    white = _orReduce(np.where(isWhite, bits, np.uint64(0)), 1)
+    black = _orReduce(np.where(isBlack, bits, np.uint64(0)), 1)
+    occupied = white | black
+    empty = ~occupied
+    kind = np.where(pieces >= 7, pieces - 6, pieces) # 1..6 in "pRNBQK" order, 0 empty
+
+    # attacks from every square, whichever color stands there
+    attacksFrom = np.zeros((n, 64), dtype = np.uint64)
+    attacksFrom |= np.where(kind == 3, _knightTable[None, :], np.uint64(0))
+    attacksFrom |= np.where(kind == 6, _kingTable[None, :], np.uint64(0))
+    attacksFrom |= np.where((kind == 1) & isWhite, _pawnTables["w"][None, :], np.uint64(0))
+    attacksFrom |= np.where((kind == 1) & isBlack, _pawnTables["b"][None, :], np.uint64(0))
+    attacksFrom |= _sliderAttacks((kind == 2) | (kind == 5), empty, _rookShifts)
+    attacksFrom |= _sliderAttacks((kind == 4) | (kind == 5), empty, _bishopShifts)
+    whiteAttacks = _orReduce(np.where(isWhite, attacksFrom, np.uint64(0)), 1)
+    blackAttacks = _orReduce(np.where(isBlack, attacksFrom, np.uint64(0)), 1)
+
+    toMove = batch.whiteToMove
+    ownSquares = np.where(toMove[:, None], isWhite, isBlack)
+    own = np.where(toMove, white, black)
+    enemy = np.where(toMove, black, white)
+    enemyAttacks = np.where(toMove, blackAttacks, whiteAttacks)
+    ownKing = _orReduce(np.where(ownSquares & (kind == 6), bits, np.uint64(0)), 1)
+    inCheck = (ownKing & enemyAttacks) != 0
+
+    # pieces: attacked squares not holding own pieces
+    ownPawns = ownSquares & (kind == 1)
+    moveMasks = np.where(ownSquares & ~ownPawns, attacksFrom & ~own[:, None], np.uint64(0))
+    # pawns: captures (en passant included) and pushes
+    epBit = np.where(batch.enpassant >= 0, np.uint64(1) << batch.enpassant.clip(0).astype(np.uint64), np.uint64(0))
+    captures = attacksFrom & (enemy | epBit)[:, None]
+    empty = empty[:, None]
+    whitePush = (bits >> np.uint64(8)) & empty
+    whiteDouble = ((whitePush >> np.uint64(8)) & empty) * (_rows == 6)[None, :]
+    blackPush = (bits << np.uint64(8)) & empty
+    blackDouble = ((blackPush << np.uint64(8)) & empty) * (_rows == 1)[None, :]
+    pushes = np.where(toMove[:, None], whitePush | whiteDouble, blackPush | blackDouble)
+    moveMasks |= np.where(ownPawns, captures | pushes, np.uint64(0))
+
+    _addCastling(batch, moveMasks, occupied, enemyAttacks, inCheck, pieces)
+
+    lastRank = np.where(toMove, np.uint64(0xFF), np.uint64(0xFF << 56))[:, None]
+    promotions = np.bitwise_count(np.where(ownPawns, moveMasks & lastRank, np.uint64(0))).sum(axis = 1)
+    moveCounts = np.bitwise_count(moveMasks).sum(axis = 1) + 3 * promotions
+    return BatchMoves(np.stack([whiteAttacks, blackAttacks], axis = 1), moveMasks, moveCounts.astype(np.int32), inCheck)
+
+# same conditions as GameState.getCastleMoves, the landing square is left to the legality check
+def _addCastling(batch, moveMasks, occupied, enemyAttacks, inCheck, pieces):
+    for side, (kingSq, target, empty, passed) in ChessEngine.castlingPaths.items():
+        color = "w" if side in (ChessEngine.whiteKingSide, ChessEngine.whiteQueenSide) else "b"
+        rookSq = ChessEngine.castlingRookSquares[target][0]
+        allowed = (batch.whiteToMove == (color == "w")) & ((batch.castling & side) != 0) & ~inCheck
+        allowed &= (pieces[:, kingSq] == pieceCodes[color+"K"]) & (pieces[:, rookSq] == pieceCodes[color+"R"])
+        allowed &= (occupied & np.uint64(empty)) == 0
+        allowed &= (enemyAttacks & np.uint64(1 << passed)) == 0
+        moveMasks[:, kingSq] |= np.where(allowed, np.uint64(1 << target), np.uint64(0))
+
+
+'''
+Differences between position i of the batch and GameState: pseudo-legal targets per square,
+move count, check flag, and legal moves missing from the masks. An empty list means they agree.
+'''
+def crossCheck(batch, moves, i):
+    gs = gameState(batch, i)
+    problems = []
+    expected = [0] * 64
+    codes = gs.getAllPossibleMoveCodes()
+    for code in codes:
+        expected[code & 63] |= 1 << ((code >> 6) & 63)
+    for sq in range(64):
+        if int(moves.moveMasks[i, sq]) != expected[sq]:
+            problems.append("square %d: targets %x, GameState %x" % (sq, int(moves.moveMasks[i, sq]), expected[sq]))
+    if moves.moveCounts[i] != len(codes):
+        problems.append("move count %d, GameState %d" % (moves.moveCounts[i], len(codes)))
+    if bool(moves.inCheck[i]) != gs.inCheck():
+        problems.append("in check %s, GameState %s" % (bool(moves.inCheck[i]), gs.inCheck()))
+    for move in gs.getValidMoves():
+        start, end = Bitboard.square(*move.start), Bitboard.square(*move.end)
+        if not int(moves.moveMasks[i, start]) >> end & 1:
+            problems.append("legal move %s missing" % move.getChessNotation())
+    return problems
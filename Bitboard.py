@@ -0,0 +1,115 @@
+'''
+Bitboard helpers for the engine.
+A bitboard is a 64-bit int where bit (row*8 + col) is set when the square is occupied,
+so row 0 / col 0 (a8) is bit 0 and row 7 / col 7 (h1) is bit 63.
+'''
+
+full = (1 << 64) - 1
+
+# (row step, col step) for the sliding directions
+north, south, east, west = (-1, 0), (1, 0), (0, 1), (0, -1)
+northEast, northWest, southEast, southWest = (-1, 1), (-1, -1), (1, 1), (1, -1)
+rookDirections = (north, south, east, west)
+bishopDirections = (northEast, northWest, southEast, southWest)
+
+knightSteps = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+kingSteps = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def square(row, col):
+    return row * 8 + col
+
+def rowCol(sq):
+    return divmod(sq, 8)
+
+def bit(row, col):
+    return 1 << (row * 8 + col)
+
+def squares(bb):
+    # yield the index of every set bit, lowest first
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+def popCount(bb):
+    return bin(bb).count("1")
+
+
+def _stepTable(steps):
+    table = []
+    for sq in range(64):
+        row, col = rowCol(sq)
+        bb = 0
+        for dr, dc in steps:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= bit(r, c)
+        table.append(bb)
+    return table
+
+def _rayTable(direction):
+    dr, dc = direction
+    table = []
+    for sq in range(64):
+        row, col = rowCol(sq)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= bit(r, c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+knightAttacks = _stepTable(knightSteps)
+kingAttacks = _stepTable(kingSteps)
+# pawnAttacks["w"][sq] are the squares a white pawn on sq attacks (towards row 0)
+pawnAttacks = {"w": _stepTable(((-1, -1), (-1, 1))), "b": _stepTable(((1, -1), (1, 1)))}
+rays = {direction: _rayTable(direction) for direction in rookDirections + bishopDirections}
+# directions where the square index grows along the ray, the nearest blocker is the lowest bit
+positiveDirections = (south, east, southEast, southWest)
+
+
+def _betweenTable():
+    table = [[0] * 64 for _ in range(64)]
+    for dr, dc in rookDirections + bishopDirections:
+        for sq in range(64):
+            row, col = rowCol(sq)
+            inBetween = 0
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                table[sq][square(r, c)] = inBetween
+                inBetween |= bit(r, c)
+                r, c = r + dr, c + dc
+    return table
+
+# between[a][b] holds the squares strictly between two squares on a common line, 0 otherwise
+between = _betweenTable()
+
+
+# nearest occupied square from sq along direction, -1 if the ray is empty
+def firstBlocker(sq, occupied, direction):
+    blockers = rays[direction][sq] & occupied
+    if not blockers:
+        return -1
+    if direction in positiveDirections:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+def rayAttacks(sq, occupied, direction):
+    first = firstBlocker(sq, occupied, direction)
+    if first < 0:
+        return rays[direction][sq]
+    return rays[direction][sq] ^ rays[direction][first]
+
+def rookAttacks(sq, occupied):
+    return (rayAttacks(sq, occupied, north) | rayAttacks(sq, occupied, south) |
+            rayAttacks(sq, occupied, east) | rayAttacks(sq, occupied, west))
+
+def bishopAttacks(sq, occupied):
+    return (rayAttacks(sq, occupied, northEast) | rayAttacks(sq, occupied, northWest) |
+            rayAttacks(sq, occupied, southEast) | rayAttacks(sq, occupied, southWest))
+
+def queenAttacks(sq, occupied):
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
@@ -1,3 +1,32 @@
+from array import array
+
+import Bitboard
+import Evaluation
+import Zobrist
+
+startFEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# castling rights bits, same order as in FEN
+whiteKingSide, whiteQueenSide, blackKingSide, blackQueenSide = 1, 2, 4, 8
+castlingLetters = "KQkq"
+# rights kept when a piece moves from or to the square: king and rook home squares lose theirs
+castlingMasks = [15] * 64
+castlingMasks[7*8 + 4] = 15 & ~(whiteKingSide | whiteQueenSide)
+castlingMasks[7*8 + 7] = 15 & ~whiteKingSide
+castlingMasks[7*8 + 0] = 15 & ~whiteQueenSide
+castlingMasks[0*8 + 4] = 15 & ~(blackKingSide | blackQueenSide)
+castlingMasks[0*8 + 7] = 15 & ~blackKingSide
+castlingMasks[0*8 + 0] = 15 & ~blackQueenSide
+# king landing square: (rook start, rook end)
+castlingRookSquares = {7*8 + 6: (7*8 + 7, 7*8 + 5), 7*8 + 2: (7*8 + 0, 7*8 + 3),
+    0*8 + 6: (0*8 + 7, 0*8 + 5), 0*8 + 2: (0*8 + 0, 0*8 + 3)}
+# right: (king square, king landing square, squares that must be empty, square the king passes)
+castlingPaths = {
+    whiteKingSide: (7*8 + 4, 7*8 + 6, Bitboard.bit(7, 5) | Bitboard.bit(7, 6), 7*8 + 5),
+    whiteQueenSide: (7*8 + 4, 7*8 + 2, Bitboard.bit(7, 1) | Bitboard.bit(7, 2) | Bitboard.bit(7, 3), 7*8 + 3),
+    blackKingSide: (0*8 + 4, 0*8 + 6, Bitboard.bit(0, 5) | Bitboard.bit(0, 6), 0*8 + 5),
+    blackQueenSide: (0*8 + 4, 0*8 + 2, Bitboard.bit(0, 1) | Bitboard.bit(0, 2) | Bitboard.bit(0, 3), 0*8 + 3)}
+
 '''
 Class to store the information about the state of the game.
 '''
@@ -17,8 +46,7 @@ class GameState():
             ["--","--","--","--","--","--","--","--"],
             ["wp","wp","wp","wp","wp","wp","wp","wp"],
             ["wR","wN","wB","wQ","wK","wB","wN","wR"]]
-        self.switcher = {"p":self.getPawnMoves, "R":self.getRookMoves, "B":self.getBishopMoves,
-         "N":self.getKnightMoves, "K":self.getKingMoves, "Q":self.getQueenMoves}
+        self.initSwitcher()
         self.whiteToMove = True
         self.moveList = []
         self.whiteKingLocation = (7,4)
@@ -26,80 +54,240 @@ class GameState():
         self.checkMate = False
         self.staleMate = False
         self.enpassantPossible = () # coordinates where enpassant capture is possible
+        self.castlingRights = whiteKingSide | whiteQueenSide | blackKingSide | blackQueenSide
+        self.halfmoveClock = 0 # plies since the last capture or pawn move
+        self.fullmoveNumber = 1 # incremented after black's move
+        self.startFEN = startFEN # position moveList is played from
+        self.initBitboards()
+        self.resetHistory()
+
+    # per-piece move generators, bound when called so Profiler can swap the methods
+    def initSwitcher(self):
+        self.switcher = {"p":self.getPawnMoves, "R":self.getRookMoves, "B":self.getBishopMoves,
+         "N":self.getKnightMoves, "K":self.getKingMoves, "Q":self.getQueenMoves}
+
+    def resetHistory(self):
+        '''
+        stateLog has one entry per move of moveList: the irreversible state before the move
+        (castling rights, en passant square, halfmove clock, zobrist key) and the captured piece.
+        repetitions counts how often each key occurred since the start position.
+        '''
+        self.zobristKey = Zobrist.computeKey(self)
+        self.stateLog = []
+        self.repetitions = {self.zobristKey: 1}
+
+    '''
+    Position from a FEN string. The castling, en passant and clock fields are optional
+    so EPD positions (first four fields only) can be read as well.
+    '''
+    @classmethod
+    def fromFEN(cls, fen):
+        gs = cls()
+        fields = fen.split()
+        if len(fields[0].split("/")) != 8:
+            raise ValueError("invalid FEN: " + fen)
+        gs.board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                else:
+                    row.append(("w" if char.isupper() else "b") + (char.upper() if char.lower() != "p" else "p"))
+            gs.board.append(row)
+        for row in range(8):
+            for col in range(8):
+                if gs.board[row][col] == "wK":
+                    gs.whiteKingLocation = (row, col)
+                elif gs.board[row][col] == "bK":
+                    gs.blackKingLocation = (row, col)
+        gs.whiteToMove = len(fields) < 2 or fields[1] == "w"
+        gs.castlingRights = 0
+        if len(fields) > 2 and fields[2] != "-":
+            for letter in fields[2]:
+                gs.castlingRights |= 1 << castlingLetters.index(letter)
+        if len(fields) > 3 and fields[3] != "-":
+            gs.enpassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        gs.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        gs.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        gs.startFEN = gs.toFEN()
+        gs.initBitboards()
+        gs.resetHistory()
+        return gs
+
+    def toFEN(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == "w" else piece[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = "".join(letter for i, letter in enumerate(castlingLetters) if self.castlingRights & (1 << i)) or "-"
+        enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]] if self.enpassantPossible else "-"
+        return "%s %s %s %s %d %d" % ("/".join(ranks), "w" if self.whiteToMove else "b", castling, enpassant,
+            self.halfmoveClock, self.fullmoveNumber)
 
     # different move logic for castling, en-passant and pawn promotion
     def makeMove(self, move):
-        self.board[move.start[0]][move.start[1]] = "--"
-        self.board[move.end[0]][move.end[1]] = move.pieceMoved
-        self.moveList.append(move) # list the moves
+        self.makeMoveCode(move.moveId)
+
+    '''
+    Makes an encoded move (see encodeMove). The state it can't be undone from is pushed to stateLog.
+    '''
+    def makeMoveCode(self, code):
+        startSq, endSq, flag = code & 63, (code >> 6) & 63, code & flagMask
+        startRow, startCol = startSq >> 3, startSq & 7
+        endRow, endCol = endSq >> 3, endSq & 7
+        pieceMoved = self.board[startRow][startCol]
+        pieceCaptured = self.board[endRow][endCol]
+        key = self.zobristKey
+        self.zobristKey ^= Zobrist.blackToMoveKey ^ Zobrist.enpassantKey(self.enpassantPossible)
+
+        self.togglePiece(pieceMoved, startSq)
+        self.board[startRow][startCol] = "--"
+        # en passant
+        if flag == enpassantFlag:
+            pieceCaptured = self.board[startRow][endCol]
+            self.togglePiece(pieceCaptured, startSq - startCol + endCol)
+            self.board[startRow][endCol] = "--"
+        elif pieceCaptured != "--":
+            self.togglePiece(pieceCaptured, endSq)
+        # castling
+        elif flag == castlingFlag:
+            # the rook jumps over the king
+            rookStart, rookEnd = castlingRookSquares[endSq]
+            rook = self.board[startRow][rookStart & 7]
+            self.togglePiece(rook, rookStart)
+            self.togglePiece(rook, rookEnd)
+            self.board[startRow][rookStart & 7] = "--"
+            self.board[startRow][rookEnd & 7] = rook
+        # pawn promotion
+        if flag == promotionFlag:
+            pieceMoved = pieceMoved[0] + promotionPieces[(code >> 12) & 3]
+        self.togglePiece(pieceMoved, endSq)
+        self.board[endRow][endCol] = pieceMoved
+        self.updateOccupancy()
+
+        self.moveList.append(code) # list the moves
+        self.stateLog.append((self.castlingRights, self.enpassantPossible, self.halfmoveClock, key, pieceCaptured))
         self.whiteToMove = not self.whiteToMove # change turn
         #update king's location
-        if move.pieceMoved == "wK":
-            self.whiteKingLocation = (move.end[0], move.end[1])
-        elif move.pieceMoved == "bK":
-            self.blackKingLocation = (move.end[0], move.end[1])
+        if pieceMoved == "wK":
+            self.whiteKingLocation = (endRow, endCol)
+        elif pieceMoved == "bK":
+            self.blackKingLocation = (endRow, endCol)
+
+        # en passant possible only right after two move pawn push is made, and only recorded when
+        # an enemy pawn can take so positions that only differ by it hash the same for repetitions
+        if pieceMoved[1] == "p" and abs(startRow-endRow) == 2 and Bitboard.pawnAttacks[pieceMoved[0]][(startSq+endSq)//2] \
+                & self.bitboards[("b" if pieceMoved[0] == "w" else "w") + "p"]:
+            self.enpassantPossible = ((startRow+endRow)//2, startCol)
+        else:
+            self.enpassantPossible = ()
+        self.zobristKey ^= Zobrist.enpassantKey(self.enpassantPossible)
 
-        # pawn promotion
-        if move.isPawnPromotion:
-            self.board[move.end[0]][move.end[1]] = move.pieceMoved[0]+'Q'
+        # castling rights are lost once the king or rook leaves (or a rook is captured on) its home square
+        rights = self.castlingRights & castlingMasks[startSq] & castlingMasks[endSq]
+        if rights != self.castlingRights:
+            self.zobristKey ^= Zobrist.castlingKeys[self.castlingRights] ^ Zobrist.castlingKeys[rights]
+            self.castlingRights = rights
 
-        # en passant
-        if move.isEnpassantMove:
-            self.board[move.start[0]][move.end[1]] = "--"
-        # en passant possible only right after two move pawn push is made
-        if move.pieceMoved[1] == "p" and abs(move.start[0]-move.end[0]) == 2:
-            self.enpassantPossible = ((move.start[0]+move.end[0])//2, move.start[1])
+        if pieceMoved[1] == "p" or flag == promotionFlag or pieceCaptured != "--":
+            self.halfmoveClock = 0
         else:
-            self.enpassantPossible = ()
+            self.halfmoveClock += 1
+        if self.whiteToMove:
+            self.fullmoveNumber += 1
+        self.repetitions[self.zobristKey] = self.repetitions.get(self.zobristKey, 0) + 1
 
+    '''
+    Takes back the last move, the state before it comes straight from stateLog.
+    '''
     def undoMove(self):
-        if self.moveList != 0:
-            move = self.moveList.pop()
-            self.board[move.start[0]][move.start[1]] = move.pieceMoved
-            self.board[move.end[0]][move.end[1]] = move.pieceCaptured
+        if self.moveList:
+            count = self.repetitions[self.zobristKey] - 1
+            if count:
+                self.repetitions[self.zobristKey] = count
+            else:
+                del self.repetitions[self.zobristKey]
+            code = self.moveList.pop()
+            self.castlingRights, self.enpassantPossible, self.halfmoveClock, key, pieceCaptured = self.stateLog.pop()
+            startSq, endSq, flag = code & 63, (code >> 6) & 63, code & flagMask
+            startRow, startCol = startSq >> 3, startSq & 7
+            endRow, endCol = endSq >> 3, endSq & 7
+
+            # the landing square still holds the (possibly promoted) piece
+            pieceLanded = self.board[endRow][endCol]
+            pieceMoved = pieceLanded[0] + "p" if flag == promotionFlag else pieceLanded
+            self.togglePiece(pieceLanded, endSq)
+            self.togglePiece(pieceMoved, startSq)
+            self.board[startRow][startCol] = pieceMoved
+            # undo en passant
+            if flag == enpassantFlag:
+                self.board[endRow][endCol] = "--" # leave landing square
+                self.board[startRow][endCol] = pieceCaptured
+                self.togglePiece(pieceCaptured, startSq - startCol + endCol)
+            else:
+                self.board[endRow][endCol] = pieceCaptured
+                if pieceCaptured != "--":
+                    self.togglePiece(pieceCaptured, endSq)
+                elif flag == castlingFlag:
+                    rookStart, rookEnd = castlingRookSquares[endSq]
+                    rook = self.board[startRow][rookEnd & 7]
+                    self.togglePiece(rook, rookEnd)
+                    self.togglePiece(rook, rookStart)
+                    self.board[startRow][rookEnd & 7] = "--"
+                    self.board[startRow][rookStart & 7] = rook
+            self.updateOccupancy()
+            self.zobristKey = key
+
             self.whiteToMove = not self.whiteToMove
             # update king's location
-            if move.pieceMoved == "wK":
-                self.whiteKingLocation = (move.start[0], move.start[1])
-            elif move.pieceMoved == "bK":
-                self.blackKingLocation = (move.start[0], move.start[1])
+            if pieceMoved == "wK":
+                self.whiteKingLocation = (startRow, startCol)
+            elif pieceMoved == "bK":
+                self.blackKingLocation = (startRow, startCol)
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
 
-            # undo en passant
-            if move.isEnpassantMove:
-                self.board[move.end[0]][move.end[1]] = "--" # leave landing square
-                self.board[move.start[0]][move.end[1]] = move.pieceCaptured
-                self.enpassantPossible = (move.end[0], move.end[1])
-            if move.pieceMoved[1] == "p" and abs(move.start[0]-move.end[1]) == 2:
-                self.enpassantPossible = ()
+    # the position occurred count times (the current occurrence included) since the start position
+    def isRepetition(self, count = 3):
+        return self.repetitions[self.zobristKey] >= count
+
+    def isFiftyMoveRule(self):
+        return self.halfmoveClock >= 100
+
+    # threefold repetition or fifty moves without a capture or pawn move
+    def isDraw(self):
+        return self.isRepetition() or self.isFiftyMoveRule()
 
     '''
     All moves considering checks
     '''
     def getValidMoves(self):
+        return [Move.fromId(code, self.board) for code in self.getValidMoveCodes()]
+
+    def getValidMoveCodes(self, buffer = None):
         '''
-        1) generate all moves
-        2) for each move, make move
-        3) generate all opponent's moves
-        4) for each oppponent move, see if they attack king
-        5) if they attack, not a valid move
+        1) find checkers, the check evasion mask and pinned pieces from the king's square
+        2) generate all moves
+        3) keep the moves that respect the masks, king moves must land on an unattacked square
+        Legal moves are written to buffer (an array("H"), a new one if not given) which is also returned.
         '''
-        # save for generating moves
-        tempEnpassantPossible = self.enpassantPossible
-        
-        moves = self.getAllPossibleMoves() 
-        # when removing from a list - move backwards
-        for i in range(len(moves)-1, -1, -1):
-            self.makeMove(moves[i])
-            # switch turns
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            # switch back
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        
-        if len(moves) == 0:
-            if self.inCheck():
+        checksAndPins = self.getChecksAndPins()
+        buffer = self.filterLegal(self.getAllPossibleMoveCodes(buffer), checksAndPins)
+
+        if not buffer:
+            if checksAndPins[0]:
                 self.checkMate = True
             else:
                 self.staleMate = True
@@ -108,8 +296,219 @@ class GameState():
             self.staleMate = False
             self.checkMate = False
 
-        self.enpassantPossible = tempEnpassantPossible
-        return moves
+        return buffer
+
+    # keeps the legal moves of possibleMoves (filtered in place), checksAndPins is from getChecksAndPins
+    def filterLegal(self, possibleMoves, checksAndPins):
+        checkers, checkMask, pinRays = checksAndPins
+        kingSq = Bitboard.square(*self.getKingLocation())
+        count = 0
+        for code in possibleMoves:
+            if self.isLegal(code, kingSq, checkMask, pinRays):
+                possibleMoves[count] = code
+                count += 1
+        del possibleMoves[count:]
+        return possibleMoves
+
+    '''
+    Legal moves in stages, every stage is generated only when the previous one is used up,
+    so a caller that stops early (a beta cutoff) never generates the rest:
+    1) hashMove
+    2) captures, most valuable victim first
+    3) killers (quiet moves that caused cutoffs in sibling positions)
+    4) the other quiet moves, in order of quietKey (a function of the move code, higher first) if given
+    hashMove and killers may come from other positions, they are only yielded when legal here.
+    buffers, three array("H") for captures, quiets and move checks, are reused instead of new
+    arrays (one set per ply, they are in use until the generator is done).
+    The position must be the same whenever the generator resumes. If nothing at all is yielded
+    checkMate or staleMate is set like getValidMoveCodes does.
+    '''
+    def getStagedMoveCodes(self, hashMove = 0, killers = (), quietKey = None, buffers = None):
+        captureBuffer, quietBuffer, checkBuffer = buffers or (None, None, array("H"))
+        checksAndPins = self.getChecksAndPins()
+        checkers, checkMask, pinRays = checksAndPins
+        kingSq = Bitboard.square(*self.getKingLocation())
+        count = 0
+        if hashMove and self.isPseudoLegal(hashMove, checkBuffer) and self.isLegal(hashMove, kingSq, checkMask, pinRays):
+            count += 1
+            yield hashMove
+        else:
+            hashMove = 0
+
+        board = self.board
+        captures = self.getCaptureMoveCodes(captureBuffer, checksAndPins)
+        for move in sorted(captures, key = lambda move: mvvLva(board, move), reverse = True):
+            if move != hashMove:
+                count += 1
+                yield move
+
+        tried = [hashMove]
+        for killer in killers:
+            if killer and killer not in tried and not isCapture(board, killer) and self.isPseudoLegal(killer, checkBuffer) \
+                    and self.isLegal(killer, kingSq, checkMask, pinRays):
+                tried.append(killer)
+                count += 1
+                yield killer
+
+        quiets = self.getQuietMoveCodes(quietBuffer, checksAndPins)
+        if quietKey is not None:
+            quiets = sorted(quiets, key = quietKey, reverse = True)
+        for move in quiets:
+            if move not in tried:
+                count += 1
+                yield move
+
+        if count == 0:
+            self.checkMate = bool(checkers)
+            self.staleMate = not checkers
+
+    # legal moves that capture (en passant included), promotions capturing a piece among them
+    def getCaptureMoveCodes(self, buffer = None, checksAndPins = None):
+        return self.filterLegal(self.getPossibleMoveCodesByKind(True, buffer), checksAndPins or self.getChecksAndPins())
+
+    # legal moves to empty squares: pushes and promotions without capture, castling, piece moves
+    def getQuietMoveCodes(self, buffer = None, checksAndPins = None):
+        return self.filterLegal(self.getPossibleMoveCodesByKind(False, buffer), checksAndPins or self.getChecksAndPins())
+
+    # is code a move getAllPossibleMoveCodes generates here, for move codes from tables or other positions
+    def isPseudoLegal(self, code, possibleMoves = None):
+        start = code & 63
+        piece = self.board[start >> 3][start & 7]
+        if piece == "--" or (piece[0] == "w") != self.whiteToMove:
+            return False
+        if possibleMoves is None:
+            possibleMoves = array("H")
+        else:
+            del possibleMoves[:]
+        self.switcher[piece[1]](start, possibleMoves)
+        return code in possibleMoves
+
+    def getChecksAndPins(self):
+        '''
+        checkers: bitboard of enemy pieces giving check
+        checkMask: squares a non-king move has to land on (block or capture the checker)
+        pinRays: {pinned square: squares it can still move to, pinner included}
+        '''
+        color, enemy = ("w", "b") if self.whiteToMove else ("b", "w")
+        kingSq = Bitboard.square(*self.getKingLocation())
+        checkers = self.attackersTo(kingSq, enemy, self.occupied)
+        if not checkers:
+            checkMask = Bitboard.full
+        elif checkers & (checkers - 1): # double check, only the king can move
+            checkMask = 0
+        else:
+            checkerSq = checkers.bit_length() - 1
+            checkMask = checkers | Bitboard.between[kingSq][checkerSq]
+
+        pinRays = {}
+        own = self.ownPieces()
+        bb = self.bitboards
+        rookLike = bb[enemy+"R"] | bb[enemy+"Q"]
+        bishopLike = bb[enemy+"B"] | bb[enemy+"Q"]
+        for directions, sliders in ((Bitboard.rookDirections, rookLike), (Bitboard.bishopDirections, bishopLike)):
+            for direction in directions:
+                blocker = Bitboard.firstBlocker(kingSq, self.occupied, direction)
+                if blocker < 0 or not own & (1 << blocker):
+                    continue
+                pinner = Bitboard.firstBlocker(blocker, self.occupied, direction)
+                if pinner >= 0 and sliders & (1 << pinner):
+                    pinRays[blocker] = Bitboard.between[kingSq][pinner] | (1 << pinner)
+        return checkers, checkMask, pinRays
+
+    def isLegal(self, code, kingSq, checkMask, pinRays):
+        start, end = code & 63, (code >> 6) & 63
+        enemy = "b" if self.whiteToMove else "w"
+        if start == kingSq:
+            # the king itself must not block the attack on its landing square
+            return not self.attackersTo(end, enemy, self.occupied ^ (1 << start))
+        if code & flagMask == enpassantFlag:
+            # both pawns leave the board at once, so test the resulting occupancy directly
+            captured = (start & ~7) | (end & 7)
+            occupied = self.occupied ^ (1 << start) ^ (1 << end) ^ (1 << captured)
+            return not self.attackersTo(kingSq, enemy, occupied)
+        if not checkMask & (1 << end):
+            return False
+        return start not in pinRays or bool(pinRays[start] & (1 << end))
+
+    '''
+    Standard algebraic notation (Nf3, exd5, e8=Q+, O-O) of a legal move in this position
+    '''
+    def getSAN(self, move):
+        if move.isCastleMove:
+            san = "O-O" if move.end[1] == 6 else "O-O-O"
+        elif move.pieceMoved[1] == "p":
+            san = ""
+            if move.pieceCaptured != "--":
+                san = move.colsToFiles[move.start[1]] + "x"
+            san += move.getRankFile(move.end[0], move.end[1])
+            if move.isPawnPromotion:
+                san += "=" + move.promotionPiece
+        else:
+            san = move.pieceMoved[1]
+            # other pieces of the same type that can reach the same square
+            others = [other for other in self.getValidMoves() if other.pieceMoved == move.pieceMoved
+                and other.end == move.end and other.start != move.start]
+            if others:
+                if all(other.start[1] != move.start[1] for other in others):
+                    san += move.colsToFiles[move.start[1]]
+                elif all(other.start[0] != move.start[0] for other in others):
+                    san += move.rowsToRanks[move.start[0]]
+                else:
+                    san += move.getRankFile(move.start[0], move.start[1])
+            if move.pieceCaptured != "--":
+                san += "x"
+            san += move.getRankFile(move.end[0], move.end[1])
+        self.makeMove(move)
+        if self.inCheck():
+            san += "#" if not self.getValidMoveCodes() else "+"
+        self.undoMove()
+        return san
+
+    '''
+    The legal Move written as san in this position, raises ValueError if there is none or it is ambiguous.
+    '''
+    def moveFromSAN(self, san):
+        text = san.rstrip("+#!?")
+        candidates = []
+        if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            col = 6 if len(text) == 3 else 2
+            candidates = [move for move in self.getValidMoves()
+                if move.pieceMoved[1] == "K" and move.end[1] == col and abs(move.start[1] - col) == 2]
+        else:
+            promotion = None
+            if "=" in text:
+                text, promotion = text.split("=")
+            elif text[-1] in "NBRQ" and text[0] in "abcdefgh":
+                text, promotion = text[:-1], text[-1]
+            piece = text[0] if text[0] in "NBRQK" else "p"
+            if piece != "p":
+                text = text[1:]
+            text = text.replace("x", "").replace("-", "")
+            if len(text) < 2 or text[-2] not in Move.filesToCols or text[-1] not in Move.ranksToRows:
+                raise ValueError("invalid SAN: " + san)
+            end = (Move.ranksToRows[text[-1]], Move.filesToCols[text[-2]])
+            hint = text[:-2] # disambiguation file and/or rank
+            for move in self.getValidMoves():
+                if move.pieceMoved[1] != piece or move.end != end:
+                    continue
+                if move.isPawnPromotion and move.promotionPiece != (promotion or "Q"):
+                    continue
+                if any((c in Move.filesToCols and Move.filesToCols[c] != move.start[1]) or
+                        (c in Move.ranksToRows and Move.ranksToRows[c] != move.start[0]) for c in hint):
+                    continue
+                candidates.append(move)
+        if len(candidates) != 1:
+            raise ValueError("%s move: %s" % ("illegal" if not candidates else "ambiguous", san))
+        return candidates[0]
+
+    '''
+    Move for this position from an OpeningBook, None when the position is not in the book.
+    '''
+    def getBookMove(self, book, best = False):
+        return book.getMove(self, best)
+
+    def getKingLocation(self):
+        return self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
 
     def inCheck(self):
         if self.whiteToMove:
@@ -117,270 +516,261 @@ class GameState():
         else:
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
+    # is the square attacked by the opponent of the side to move
     def squareUnderAttack(self, row, col):
-        self.whiteToMove = not self.whiteToMove # switch to opponent's pov
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove # switch turns back
-        for move in oppMoves:
-            if (move.end[0] == row) and (move.end[1] == col): # if square under attack
-                return True
-        return False       
+        enemy = "b" if self.whiteToMove else "w"
+        return self.attackersTo(Bitboard.square(row, col), enemy, self.occupied) != 0
+
+    def attackersTo(self, sq, color, occupied):
+        '''
+        Pieces of color attacking sq, found by looking outward from sq with each piece's attack pattern.
+        Pieces missing from occupied are ignored and don't block sliders.
+        '''
+        bb = self.bitboards
+        other = "b" if color == "w" else "w"
+        attackers = (Bitboard.pawnAttacks[other][sq] & bb[color+"p"]) | \
+            (Bitboard.knightAttacks[sq] & bb[color+"N"]) | \
+            (Bitboard.kingAttacks[sq] & bb[color+"K"]) | \
+            (Bitboard.bishopAttacks(sq, occupied) & (bb[color+"B"] | bb[color+"Q"])) | \
+            (Bitboard.rookAttacks(sq, occupied) & (bb[color+"R"] | bb[color+"Q"]))
+        return attackers & occupied
 
     '''
     All moves
     '''
     def getAllPossibleMoves(self):
-        possibleMoves = [] # Move((4,6),(4,4), self.board)
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                color = self.board[row][col][0]
-                if(color == "w" and self.whiteToMove) or (color == "b" and not self.whiteToMove):
-                    piece = self.board[row][col][1]
-                    self.switcher[piece](row, col, possibleMoves)
+        return [Move.fromId(code, self.board) for code in self.getAllPossibleMoveCodes()]
+
+    def getAllPossibleMoveCodes(self, possibleMoves = None):
+        if possibleMoves is None:
+            possibleMoves = array("H")
+        else:
+            del possibleMoves[:]
+        color = "w" if self.whiteToMove else "b"
+        # walk the side's piece bitboards instead of all 64 squares
+        for piece in "pRNBQK":
+            for sq in Bitboard.squares(self.bitboards[color+piece]):
+                self.switcher[piece](sq, possibleMoves)
         return possibleMoves
 
-    def getPawnMoves(self, row, col, possibleMoves):
-        # White moves
-        if self.whiteToMove: 
-            if self.board[row-1][col] == "--":
-                possibleMoves.append(Move((row, col), (row-1, col), self.board))
-                if row == 6 and self.board[row-2][col] == "--":
-                    possibleMoves.append(Move((row, col), (row-2, col), self.board))
-            # Captures
-            if col-1 >= 0: # Left side capture
-                if self.board[row-1][col-1][0] == "b":
-                    possibleMoves.append(Move((row, col), (row-1, col-1), self.board))
-                #enpassant
-                elif (row-1, col-1) == self.enpassantPossible:
-                    possibleMoves.append(Move((row, col), (row-1, col-1), self.board, isEnpassantMove = True))
-            if col+1 <= 7: # Right side capture
-                if self.board[row-1][col+1][0] == "b":
-                    possibleMoves.append(Move((row, col), (row-1, col+1), self.board))
-                #enpassant
-                elif (row-1, col+1) == self.enpassantPossible:
-                    possibleMoves.append(Move((row, col), (row-1, col+1), self.board, isEnpassantMove = True))
-        # Black moves
-        if not self.whiteToMove:
-            if self.board[row+1][col] == "--":
-                possibleMoves.append(Move((row, col), (row+1, col), self.board))
-                if row == 1 and self.board[row+2][col] == "--":
-                    possibleMoves.append(Move((row, col), (row+2, col), self.board))
-            # Captures
-            if col-1 >= 0: # Left side capture
-                if self.board[row+1][col-1][0] == "w":
-                    possibleMoves.append(Move((row, col), (row+1, col-1), self.board))
-                #enpassant
-                elif (row+1, col-1) == self.enpassantPossible:
-                    possibleMoves.append(Move((row, col), (row+1, col-1), self.board, isEnpassantMove = True))
-            if col+1 <= 7: # Right side capture
-                if self.board[row+1][col+1][0] == "w":
-                    possibleMoves.append(Move((row, col), (row+1, col+1), self.board))
-                #enpassant
-                elif (row+1, col+1) == self.enpassantPossible:
-                    possibleMoves.append(Move((row, col), (row+1, col+1), self.board, isEnpassantMove = True))
-
-    def getRookMoves(self, row, col, possibleMoves):
-        r = row
-        c = col
-        canEat = "b"
+    # pseudo-legal captures only (captures = True) or quiet moves only, together the same moves as above
+    def getPossibleMoveCodesByKind(self, captures, possibleMoves = None):
+        if possibleMoves is None:
+            possibleMoves = array("H")
+        else:
+            del possibleMoves[:]
         if self.whiteToMove:
-            canEat = "b"
+            color, enemy, opponent, step, lastRow = "w", "b", self.blackPieces, -8, 0
         else:
-            canEat = "w"
-        # Down
-        for r in range(row+1, 8, 1):
-            if self.board[r][col] == "--":
-                possibleMoves.append(Move((row, col), (r, col), self.board))
-            elif self.board[r][col][0] == canEat:
-                possibleMoves.append(Move((row, col), (r, col), self.board))
-                break
-            else:
-                break
-        # Up
-        for r in range(row-1, -1, -1):
-            if self.board[r][col] == "--":
-                possibleMoves.append(Move((row, col), (r, col), self.board))
-            elif self.board[r][col][0] == canEat:
-                possibleMoves.append(Move((row, col), (r, col), self.board))
-                break
-            else:
-                break
-        # Right
-        for c in range(col+1, 8, 1):
-            if self.board[row][c] == "--":
-                possibleMoves.append(Move((row, col), (row, c), self.board))
-            elif self.board[row][c][0] == canEat:
-                possibleMoves.append(Move((row, col), (row, c), self.board))
-                break
-            else:
-                break
-        # Left
-        for c in range(col-1, -1, -1):
-            if self.board[row][c] == "--":
-                possibleMoves.append(Move((row, col), (row, c), self.board))
-            elif self.board[row][c][0] == canEat:
-                possibleMoves.append(Move((row, col), (row, c), self.board))
-                break
+            color, enemy, opponent, step, lastRow = "b", "w", self.whitePieces, 8, 7
+        targets = opponent if captures else Bitboard.full & ~self.occupied
+        bb = self.bitboards
+        pawns = bb[color+"p"]
+        if captures:
+            for sq in Bitboard.squares(pawns):
+                for target in Bitboard.squares(Bitboard.pawnAttacks[color][sq] & opponent):
+                    self.addPawnMove(sq, target, lastRow, possibleMoves)
+            if self.enpassantPossible:
+                target = Bitboard.square(*self.enpassantPossible)
+                # our pawns attacking the square stand where an enemy pawn on it would attack
+                for sq in Bitboard.squares(Bitboard.pawnAttacks[enemy][target] & pawns):
+                    possibleMoves.append(encodeMove(sq, target, enpassantFlag))
+        else:
+            # all pushes at once, double pushes continue from the third rank
+            if self.whiteToMove:
+                singles = (pawns >> 8) & targets
+                doubles = ((singles & (0xFF << 40)) >> 8) & targets
             else:
-                break
+                singles = (pawns << 8) & targets
+                doubles = ((singles & (0xFF << 16)) << 8) & targets
+            for target in Bitboard.squares(singles):
+                self.addPawnMove(target - step, target, lastRow, possibleMoves)
+            for target in Bitboard.squares(doubles):
+                possibleMoves.append(encodeMove(target - 2*step, target))
+        occupied = self.occupied
+        for sq in Bitboard.squares(bb[color+"N"]):
+            self.addMoves(sq, Bitboard.knightAttacks[sq] & targets, possibleMoves)
+        for sq in Bitboard.squares(bb[color+"B"] | bb[color+"Q"]):
+            self.addMoves(sq, Bitboard.bishopAttacks(sq, occupied) & targets, possibleMoves)
+        for sq in Bitboard.squares(bb[color+"R"] | bb[color+"Q"]):
+            self.addMoves(sq, Bitboard.rookAttacks(sq, occupied) & targets, possibleMoves)
+        for sq in Bitboard.squares(bb[color+"K"]):
+            self.addMoves(sq, Bitboard.kingAttacks[sq] & targets, possibleMoves)
+            if not captures:
+                self.getCastleMoves(sq, possibleMoves)
+        return possibleMoves
 
-    def getBishopMoves(self, row, col, possibleMoves):
-        r = row
-        c = col
-        canEat = "b"
+    def getPawnMoves(self, sq, possibleMoves):
         if self.whiteToMove:
-            canEat = "b"
+            color, opponent, step, startRow, lastRow = "w", self.blackPieces, -8, 6, 0
         else:
-            canEat = "w"
-
-        # DownRight
-        if col+1 < 8 and row+1 < 8:
-            for r, c in zip(range(row+1, 8, 1), range(col+1, 8, 1)):
-                if (self.board[r][c] == "--"):
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                elif self.board[r][c][0] == canEat:
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                    break                
-                else:
-                    break
-        # DownLeft
-        if(col-1 >= 0 and row+1 < 8):
-            for r, c in zip(range(row+1, 8, 1), range(col-1, -1, -1)):
-                if (self.board[r][c] == "--"):
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                elif self.board[r][c][0] == canEat:
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                    break                
-                else:
-                    break
-        
-        # UpLeft
-        if(col-1 >= 0 and row-1 >= 0):
-            for r, c in zip(range(row-1, -1, -1), range(col-1, -1, -1)):
-                if (self.board[r][c] == "--"):
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                elif self.board[r][c][0] == canEat:
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                    break                
-                else:
-                    break
-
-        # UpRight
-        if(col+1 < 8 and row-1 >= 0):
-            for r, c in zip(range(row-1, -1, -1), range(col+1, 8, 1)):
-                if (self.board[r][c] == "--"):
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                elif self.board[r][c][0] == canEat:
-                    possibleMoves.append(Move((row, col), (r, c), self.board))
-                    break                
-                else:
-                    break
+            color, opponent, step, startRow, lastRow = "b", self.whitePieces, 8, 1, 7
+        # pushes
+        target = sq + step
+        if not self.occupied & (1 << target):
+            self.addPawnMove(sq, target, lastRow, possibleMoves)
+            if sq >> 3 == startRow and not self.occupied & (1 << (target + step)):
+                possibleMoves.append(encodeMove(sq, target + step))
+        # captures
+        attacks = Bitboard.pawnAttacks[color][sq]
+        for target in Bitboard.squares(attacks & opponent):
+            self.addPawnMove(sq, target, lastRow, possibleMoves)
+        #enpassant
+        if self.enpassantPossible:
+            target = Bitboard.square(*self.enpassantPossible)
+            if attacks & (1 << target):
+                possibleMoves.append(encodeMove(sq, target, enpassantFlag))
+
+    def addPawnMove(self, sq, target, lastRow, possibleMoves):
+        if target >> 3 == lastRow:
+            for piece in "QNRB":
+                possibleMoves.append(encodeMove(sq, target, promotionFlag, piece))
+        else:
+            possibleMoves.append(encodeMove(sq, target))
+
+    def getRookMoves(self, sq, possibleMoves):
+        attacks = Bitboard.rookAttacks(sq, self.occupied)
+        self.addMoves(sq, attacks & ~self.ownPieces(), possibleMoves)
 
+    def getBishopMoves(self, sq, possibleMoves):
+        attacks = Bitboard.bishopAttacks(sq, self.occupied)
+        self.addMoves(sq, attacks & ~self.ownPieces(), possibleMoves)
 
-    def getKnightMoves(self, row, col, possibleMoves):
-        r = row
-        c = col
-        canEat = "b"
+    def getKnightMoves(self, sq, possibleMoves):
+        self.addMoves(sq, Bitboard.knightAttacks[sq] & ~self.ownPieces(), possibleMoves)
+
+    # not built on getBishopMoves/getRookMoves, so the profiler counts a queen's moves only once
+    def getQueenMoves(self, sq, possibleMoves):
+        attacks = Bitboard.queenAttacks(sq, self.occupied)
+        self.addMoves(sq, attacks & ~self.ownPieces(), possibleMoves)
+
+    def getKingMoves(self, sq, possibleMoves):
+        self.addMoves(sq, Bitboard.kingAttacks[sq] & ~self.ownPieces(), possibleMoves)
+        self.getCastleMoves(sq, possibleMoves)
+
+    '''
+    Castling needs the right, empty squares between king and rook and a king that is not in check
+    and does not pass an attacked square. The landing square is checked in isLegal like any king move.
+    '''
+    def getCastleMoves(self, sq, possibleMoves):
         if self.whiteToMove:
-            canEat = "b"
+            color, enemy, sides = "w", "b", (whiteKingSide, whiteQueenSide)
         else:
-            canEat = "w"
-
-        # RightSide
-        if(col+1 < 8): # check first column edge
-            if(row+2 < 8): # check both row edges
-                if (self.board[row+2][col+1] == "--") or (self.board[row+2][col+1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+2, col+1), self.board))
-            if(row-2 >= 0):
-                if (self.board[row-2][col+1] == "--") or (self.board[row-2][col+1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-2, col+1), self.board))
-        if(col+2 < 8): # check second column edge
-            if(row+1 < 8): # check both row edges
-                if (self.board[row+1][col+2] == "--") or (self.board[row+1][col+2][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+1, col+2), self.board))
-            if(row-1 >= 0):
-                if (self.board[row-1][col+2] == "--") or (self.board[row-1][col+2][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-1, col+2), self.board))    
-        # LeftSide
-        if(col-1 >= 0): # check first column edge
-            if(row+2 < 8): # check both row edges
-                if (self.board[row+2][col-1] == "--") or (self.board[row+2][col-1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+2, col-1), self.board))
-            if(row-2 >= 0):
-                if (self.board[row-2][col-1] == "--") or (self.board[row-2][col-1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-2, col-1), self.board))
-        if(col-2 >= 0): # check second column edge
-            if(row+1 < 8): # check both row edges
-                if (self.board[row+1][col-2] == "--") or (self.board[row+1][col-2][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+1, col-2), self.board))
-            if(row-1 >= 0):
-                if (self.board[row-1][col-2] == "--") or (self.board[row-1][col-2][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-1, col-2), self.board))    
-
-    def getQueenMoves(self, row, col, possibleMoves):
-        self.getBishopMoves(row, col, possibleMoves)
-        self.getRookMoves(row, col, possibleMoves)
-
-    def getKingMoves(self, row, col, possibleMoves):
-        canEat = "b"
-        if self.whiteToMove:
-            canEat = "b"
+            color, enemy, sides = "b", "w", (blackKingSide, blackQueenSide)
+        if not self.castlingRights & (sides[0] | sides[1]) or self.attackersTo(sq, enemy, self.occupied):
+            return
+        for side in sides:
+            if not self.castlingRights & side:
+                continue
+            kingSq, target, empty, passed = castlingPaths[side]
+            rookSq = castlingRookSquares[target][0]
+            if sq == kingSq and self.bitboards[color+"R"] & (1 << rookSq) and not self.occupied & empty \
+                    and not self.attackersTo(passed, enemy, self.occupied):
+                possibleMoves.append(encodeMove(sq, target, castlingFlag))
+
+    # one move per set bit of targets
+    def addMoves(self, sq, targets, possibleMoves):
+        while targets:
+            lsb = targets & -targets
+            possibleMoves.append(sq | (lsb.bit_length() - 1) << 6)
+            targets ^= lsb
+
+    def ownPieces(self):
+        return self.whitePieces if self.whiteToMove else self.blackPieces
+
+    '''
+    Bitboards: one int per piece ("wp", "bK", ...) plus occupancy masks.
+    self.board is kept in sync as the mailbox view used by the GUI and Move.
+    '''
+    def initBitboards(self):
+        self.bitboards = {color+piece: 0 for color in "wb" for piece in "pRNBQK"}
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col] != "--":
+                    self.bitboards[self.board[row][col]] |= Bitboard.bit(row, col)
+        self.updateOccupancy()
+        # evaluation terms kept up to date by togglePiece
+        self.mgScore, self.egScore, self.phase = Evaluation.computeScores(self.board)
+        self.pawnKey = 0 # Zobrist key of the pawns only, for the pawn hash table
+        for piece in ("wp", "bp"):
+            for sq in Bitboard.squares(self.bitboards[piece]):
+                self.pawnKey ^= Zobrist.pieceKeys[piece][sq]
+
+    def updateOccupancy(self):
+        bb = self.bitboards
+        self.whitePieces = bb["wp"] | bb["wR"] | bb["wN"] | bb["wB"] | bb["wQ"] | bb["wK"]
+        self.blackPieces = bb["bp"] | bb["bR"] | bb["bN"] | bb["bB"] | bb["bQ"] | bb["bK"]
+        self.occupied = self.whitePieces | self.blackPieces
+
+    # flips the bit of piece on sq, used both to place and to remove a piece
+    def togglePiece(self, piece, sq):
+        bb = self.bitboards[piece] ^ (1 << sq)
+        self.bitboards[piece] = bb
+        key = Zobrist.pieceKeys[piece][sq]
+        self.zobristKey ^= key
+        if piece[1] == "p":
+            self.pawnKey ^= key
+        mg, eg, phase = Evaluation.pieceSquare[piece][sq]
+        if bb >> sq & 1: # placed
+            self.mgScore += mg
+            self.egScore += eg
+            self.phase += phase
         else:
-            canEat = "w"
-
-        # RightSide
-        if col+1 < 8:
-            # right
-            if (self.board[row][col+1] == "--") or (self.board[row][col+1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row, col+1), self.board))
-            # diagonal down
-            if row+1 < 8:
-                if (self.board[row+1][col+1] == "--") or (self.board[row+1][col+1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+1, col+1), self.board))    
-            # diagonal up
-            if row-1 >= 0:
-                if (self.board[row-1][col+1] == "--") or (self.board[row-1][col+1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-1, col+1), self.board))
-        # Down
-        if row+1 < 8:
-            if (self.board[row+1][col] == "--") or (self.board[row+1][col][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+1, col), self.board))
-        # Up
-        if row-1 >= 0:
-            if (self.board[row-1][col] == "--") or (self.board[row-1][col][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-1, col), self.board))
-        # LeftSide
-        if col-1 >= 0:
-            # left
-            if (self.board[row][col-1] == "--") or (self.board[row][col-1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row, col-1), self.board))
-            # diagonal down
-            if row+1 < 8:
-                if (self.board[row+1][col-1] == "--") or (self.board[row+1][col-1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row+1, col-1), self.board))    
-            # diagonal up
-            if row-1 >= 0:
-                if (self.board[row-1][col-1] == "--") or (self.board[row-1][col-1][0] == canEat):
-                    possibleMoves.append(Move((row, col), (row-1, col-1), self.board))
+            self.mgScore -= mg
+            self.egScore -= eg
+            self.phase -= phase
 
 
 
 
+'''
+Moves are encoded in 16 bits: start square (6 bits), end square (6 bits),
+promotion piece (2 bits, index into promotionPieces) and a flag (2 bits).
+Squares are row*8 + col like the bitboards.
+'''
+normalFlag = 0
+promotionFlag = 1 << 14
+enpassantFlag = 2 << 14
+castlingFlag = 3 << 14
+flagMask = 3 << 14
+squaresMask = (1 << 12) - 1
+promotionPieces = "NBRQ"
+
+def encodeMove(startSq, endSq, flag = normalFlag, promotionPiece = "N"):
+    return startSq | (endSq << 6) | (promotionPieces.index(promotionPiece) << 12) | flag
+
+# move ordering values, pieces are read from the board before the move is made
+pieceValues = {"p": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+
+def pieceOn(board, sq):
+    return board[sq >> 3][sq & 7]
+
+def isCapture(board, move):
+    return pieceOn(board, (move >> 6) & 63) != "--" or move & flagMask == enpassantFlag
+
+# most valuable victim first, least valuable attacker breaks ties
+def mvvLva(board, move):
+    victim = pieceOn(board, (move >> 6) & 63)
+    victimValue = pieceValues[victim[1]] if victim != "--" else pieceValues["p"] # en passant
+    return 10 * victimValue - pieceValues[pieceOn(board, move & 63)[1]] // 10
+
+
 '''
 class to store information about the moves
+Thin wrapper around the encoded move for the GUI, move generation and search work on the codes.
 '''
 class Move():
     ranksToRows = {"8":0,"7":1,"6":2,"5":3,"4":4,"3":5,"2":6,"1":7}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a":0,"b":1,"c":2,"d":3,"e":4,"f":5,"g":6,"h":7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    __slots__ = ("start", "end", "pieceMoved", "pieceCaptured", "moveId", "isPawnPromotion", "isEnpassantMove", "isCastleMove")
 
-    def __init__(self, start, end, board, isEnpassantMove = False):
+    def __init__(self, start, end, board, isEnpassantMove = False, promotionPiece = "Q"):
         self.start = start
         self.end = end
         self.pieceMoved = board[self.start[0]][self.start[1]] # first row then col
         self.pieceCaptured = board[self.end[0]][self.end[1]]
-        self.moveId = self.start[0] * 1000 + self.start[1] * 100 + self.end[0] * 10 + self.end[1]
         self.isPawnPromotion = False
         # maybe move logic into pawnMove
         if (self.pieceMoved == "wp" and self.end[0] == 0) or (self.pieceMoved == "bp" and self.end[0] == 7): 
@@ -388,7 +778,27 @@ class Move():
         self.isEnpassantMove = isEnpassantMove
         if self.isEnpassantMove:
             self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
-        
+        # the king moving two squares is always castling
+        self.isCastleMove = self.pieceMoved[1:] == "K" and abs(self.start[1] - self.end[1]) == 2
+        startSq, endSq = start[0]*8 + start[1], end[0]*8 + end[1]
+        if self.isPawnPromotion:
+            self.moveId = encodeMove(startSq, endSq, promotionFlag, promotionPiece)
+        elif self.isEnpassantMove:
+            self.moveId = encodeMove(startSq, endSq, enpassantFlag)
+        elif self.isCastleMove:
+            self.moveId = encodeMove(startSq, endSq, castlingFlag)
+        else:
+            self.moveId = encodeMove(startSq, endSq)
+
+    @classmethod
+    def fromId(cls, moveId, board):
+        start, end = divmod(moveId & 63, 8), divmod((moveId >> 6) & 63, 8)
+        flag = moveId & flagMask
+        return cls(start, end, board, flag == enpassantFlag, promotionPieces[(moveId >> 12) & 3])
+
+    @property
+    def promotionPiece(self):
+        return promotionPieces[(self.moveId >> 12) & 3] if self.isPawnPromotion else None
 
     def isValid(self):
         if self.pieceMoved != "--":
@@ -396,17 +806,18 @@ class Move():
         else:
             return False
 
+    # same squares and promotion piece, the flag follows from the position
     def __eq__(self,other):
         if isinstance(other, Move):
-            return self.moveId == other.moveId
+            return self.moveId & ~flagMask == other.moveId & ~flagMask
         return False
 
+    def __hash__(self):
+        return hash(self.moveId & ~flagMask)
+
     def getChessNotation(self):
         #TBD real chess notation
         return self.getRankFile(self.start[0], self.start[1]) + self.getRankFile(self.end[0], self.end[1])
 
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowsToRanks[row]
-
-
-
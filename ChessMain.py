@@ -1,35 +1,67 @@
+import threading
+
 import pygame as p
 import ChessEngine
+import EngineWorker
+import Profiler
 
 width = 512
 height = 512
 dimension = 8
 squareSize = height//dimension
-fps = 15
+engineTime = 3.0 # seconds the engine gets per move
 images = {}
+engineEvent = p.USEREVENT + 1 # posted when an EngineWorker response arrives
+profileFile = "profile.json" # engine profile written when profiling is switched off
 
 
+'''
+Controls: click a piece and its target square to move, left arrow undoes,
+space lets the engine move for the side to move and escape cancels the engine.
+p switches profiling of the engine process on and off, its numbers are shown on top of the board.
+Move generation and search run in EngineWorker's process, answers come in as engineEvents.
+The loop sleeps until there is an event and only redraws the squares that changed.
+'''
 def main():
     p.init()
     screen = p.display.set_mode((width,height))
-    clock = p.time.Clock()
-    screen.fill(p.Color("white"))
+    font = p.font.SysFont("Helvetica", 20, True)
+    smallFont = p.font.SysFont("Courier", 12, True)
     gs = ChessEngine.GameState()
-    validMoves = gs.getValidMoves()
+    engine = EngineWorker.EngineWorker()
+    listener = threading.Thread(target = listenEngine, args = (engine,), daemon = True)
+    listener.start()
+    validMoves = []
+    pending = engine.request("validMoves", gs) # id of the request we are waiting for, None when idle
+    thinking = False # pending request is a search
     moveMade = False # generate valid moves when move is made (flag variable)
+    profiling = False
+    profileLines = [] # overlay text, empty when profiling is off
 
     loadImages()
+    boardSurface = drawBoardSurface()
     squareSelected = () # selected square (row, col)
     playerClicks = [] # track player clicks
+    # what is on screen: None forces a full redraw
+    shownBoard = None
+    shownSelected = ()
+    shownThinking = False
+    shownLines = []
+    shownOverlay = None # rect of the overlay on screen
 
 
     running = True
     while running:
-        for e in p.event.get():
+        # sleep until something happens
+        for e in [p.event.wait()] + p.event.get():
             # Quit event
             if e.type == p.QUIT:
                 running = False
 
+            # window uncovered or resized, everything has to be drawn again
+            elif e.type in (p.VIDEOEXPOSE, p.WINDOWEXPOSED):
+                shownBoard = None
+
             # Mouse click event
             elif e.type == p.MOUSEBUTTONDOWN:
                 location = p.mouse.get_pos() # mouse location x,y
@@ -45,46 +77,123 @@ def main():
                 if len(playerClicks) == 2: # check if second click -> make move
                     move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
                     # check if the move is valid (cant move empty sq. on top of piece)
+                    # validMoves is empty while the engine is busy
                     for i in range(len(validMoves)):
-                        if move == validMoves[i]: 
+                        if move == validMoves[i]:
                             #print(move.getChessNotation())
                             gs.makeMove(validMoves[i])
                             moveMade = True
                             squareSelected = ()
                             playerClicks = []
+                            break
                     if not moveMade:
                         playerClicks = [squareSelected]
 
             # Key press event
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_LEFT:
+                    engine.cancel()
                     gs.undoMove()
                     moveMade = True
+                elif e.key == p.K_SPACE and pending is None and validMoves:
+                    pending = engine.request("bestMove", gs, timeLimit = engineTime)
+                    thinking = True
+                    validMoves = []
+                elif e.key == p.K_ESCAPE and thinking:
+                    engine.cancel()
+                    moveMade = True # back to waiting for the player
+                elif e.key == p.K_p:
+                    profiling = not profiling
+                    engine.request("profile", gs, enable = profiling)
+
+            elif e.type == engineEvent:
+                requestId, kind, result = e.response
+                if kind == "profile":
+                    if profiling:
+                        profileLines = Profiler.summary(result)
+                    else:
+                        Profiler.save(profileFile, result)
+                        profileLines = []
+                    continue
+                if requestId != pending: # answer to a cancelled or replaced request
+                    continue
+                pending = None
+                if kind == "validMoves":
+                    codes, gs.checkMate, gs.staleMate = result
+                    validMoves = [ChessEngine.Move.fromId(code, gs.board) for code in codes]
+                elif kind == "bestMove":
+                    thinking = False
+                    if result[0] is not None:
+                        gs.makeMoveCode(result[0])
+                    moveMade = True
 
-        # Whenever move is made - generate valid moves
-        if moveMade:
-            validMoves = gs.getValidMoves()
-            moveMade = False
-
-        drawGameState(screen, gs)
-        clock.tick(fps)
-        p.display.flip()
+            # Whenever move is made - generate valid moves
+            if moveMade:
+                validMoves = []
+                pending = engine.request("validMoves", gs)
+                thinking = False
+                moveMade = False
+
+        if shownBoard is None:
+            drawGameState(screen, gs, boardSurface, squareSelected)
+            dirty = [screen.get_rect()]
+        else:
+            squares = changedSquares(shownBoard, gs.board)
+            if squareSelected != shownSelected:
+                squares.update(sq for sq in (squareSelected, shownSelected) if sq)
+            if thinking != shownThinking:
+                squares.update((dimension-1, col) for col in range(dimension)) # the label sits on the bottom row
+            if shownOverlay is not None and profileLines != shownLines:
+                squares.update(squaresUnder(shownOverlay))
+            dirty = drawSquares(screen, gs.board, boardSurface, squares, squareSelected)
+        if thinking:
+            dirty.append(drawText(screen, font, "thinking... (esc to cancel)"))
+        if profileLines and (dirty or profileLines != shownLines):
+            shownOverlay = drawOverlay(screen, smallFont, profileLines)
+            dirty.append(shownOverlay)
+        elif not profileLines:
+            shownOverlay = None
+        if dirty:
+            p.display.update(dirty)
+        shownBoard = [row[:] for row in gs.board]
+        shownSelected = squareSelected
+        shownThinking = thinking
+        shownLines = profileLines
+
+    engine.close()
+    listener.join(timeout = 1)
+
+# forwards EngineWorker responses into the pygame event queue
+def listenEngine(engine):
+    while True:
+        response = engine.wait()
+        if response is None:
+            return
+        p.event.post(p.event.Event(engineEvent, response = response))
 
 def loadImages():
     pieces = ["bp","wp","bR","wR","bN","wN","bB","wB","bQ","wQ","bK","wK"]
     for piece in pieces:
         images[piece] = p.transform.scale(p.image.load("images/"+piece+".png"), (squareSize,squareSize))
 
-def drawGameState(screen, gs):
-    drawBoard(screen)
+def drawGameState(screen, gs, boardSurface, squareSelected = ()):
+    drawBoard(screen, boardSurface)
+    if squareSelected:
+        drawHighlight(screen, squareSelected)
     drawPieces(screen, gs.board)
 
-def drawBoard(screen):
+# the empty board is drawn once and then blitted
+def drawBoardSurface():
+    surface = p.Surface((width, height))
     colors = [p.Color("white"), p.Color("light blue")]
     for row in range(dimension):
         for col in range(dimension):
             color = colors[((row+col)%2)]
-            p.draw.rect(screen, color, p.Rect(col*squareSize,row*squareSize,squareSize,squareSize))
+            p.draw.rect(surface, color, p.Rect(col*squareSize,row*squareSize,squareSize,squareSize))
+    return surface
+
+def drawBoard(screen, boardSurface):
+    screen.blit(boardSurface, (0, 0))
 
 def drawPieces(screen, board):
     for row in range(dimension):
@@ -93,6 +202,43 @@ def drawPieces(screen, board):
             if piece != "--": #not empty
                 screen.blit(images[piece],p.Rect(col*squareSize,row*squareSize,squareSize,squareSize))
 
+def drawHighlight(screen, square):
+    rect = p.Rect(square[1]*squareSize, square[0]*squareSize, squareSize, squareSize)
+    p.draw.rect(screen, p.Color("gold"), rect, 3)
+
+def changedSquares(oldBoard, board):
+    return {(row, col) for row in range(dimension) for col in range(dimension) if oldBoard[row][col] != board[row][col]}
+
+# redraws only the given squares, returns their rects for display.update
+def drawSquares(screen, board, boardSurface, squares, squareSelected):
+    rects = []
+    for row, col in squares:
+        rect = p.Rect(col*squareSize, row*squareSize, squareSize, squareSize)
+        screen.blit(boardSurface, rect, rect)
+        if (row, col) == squareSelected:
+            drawHighlight(screen, squareSelected)
+        piece = board[row][col]
+        if piece != "--":
+            screen.blit(images[piece], rect)
+        rects.append(rect)
+    return rects
+
+# lines of text in the top left corner, returns the rect they cover
+def drawOverlay(screen, font, lines):
+    rect = p.Rect(0, 0, 0, 0)
+    for i, line in enumerate(lines):
+        label = font.render(line, True, p.Color("white"), p.Color("black"))
+        rect.union_ip(screen.blit(label, (0, i * label.get_height())))
+    return rect
+
+def squaresUnder(rect):
+    return {(row, col) for row in range(rect.top // squareSize, min((rect.bottom - 1) // squareSize + 1, dimension))
+        for col in range(rect.left // squareSize, min((rect.right - 1) // squareSize + 1, dimension))}
+
+def drawText(screen, font, text):
+    label = font.render(text, True, p.Color("dark red"), p.Color("white"))
+    return screen.blit(label, (4, height - label.get_height() - 4))
+
 
 
 
@@ -0,0 +1,72 @@
+'''
+EPD (Extended Position Description) reading.
+An EPD line is the first four FEN fields followed by operations, e.g.
+
+    r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - bm Bb5; id "test 1";
+
+readEPD yields positions one line at a time so large files are never loaded into memory.
+'''
+import shlex
+
+import ChessEngine
+
+
+'''
+Returns (GameState, operations) where operations maps each opcode to its list of operands.
+The hmvc and fmvn operations set the move clocks.
+'''
+def parseEPD(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("invalid EPD: " + line)
+    operations = parseOperations(fields[4]) if len(fields) > 4 else {}
+    halfmove = operations.get("hmvc", ["0"])[0]
+    fullmove = operations.get("fmvn", ["1"])[0]
+    gs = ChessEngine.GameState.fromFEN(" ".join(fields[:4] + [halfmove, fullmove]))
+    return gs, operations
+
+def parseOperations(text):
+    operations = {}
+    for operation in splitOperations(text):
+        tokens = shlex.split(operation)
+        if tokens:
+            operations[tokens[0]] = tokens[1:]
+    return operations
+
+# split on the semicolons that are not inside a quoted string
+def splitOperations(text):
+    operation = ""
+    quoted = False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == ";" and not quoted:
+            yield operation.strip()
+            operation = ""
+        else:
+            operation += char
+    if operation.strip():
+        yield operation.strip()
+
+'''
+Lazily yields (GameState, operations) for every position of an EPD file (or any iterable of lines).
+Blank lines and lines starting with # are skipped.
+'''
+def readEPD(source):
+    if isinstance(source, str):
+        with open(source) as f:
+            yield from readEPD(f)
+        return
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield parseEPD(line)
+
+def toEPD(gs, operations = None):
+    epd = " ".join(gs.toFEN().split()[:4])
+    for opcode, operands in (operations or {}).items():
+        epd += " " + " ".join([opcode] + [quote(operand) for operand in operands]) + ";"
+    return epd
+
+def quote(operand):
+    return '"%s"' % operand if " " in operand or ";" in operand or not operand else operand
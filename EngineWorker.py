@@ -0,0 +1,108 @@
+'''
+Engine work (move generation, search) in a separate process so the GUI never blocks.
+
+Requests and responses go through queues and carry a request id. Responses to requests
+that were cancelled or replaced by a newer one are simply ignored by the caller.
+The position is sent as a start FEN plus the move codes played from it.
+'''
+import multiprocessing
+import threading
+
+import ChessEngine
+import Profiler
+import Search
+
+profileInterval = 0.5 # seconds between profile reports while profiling is on
+
+
+class _CancelFlag():
+    # stopEvent for Searcher.search: set once the request's id has been cancelled
+    def __init__(self, requestId, cancelledId):
+        self.requestId = requestId
+        self.cancelledId = cancelledId
+
+    def is_set(self):
+        return self.cancelledId.value >= self.requestId
+
+
+# reports Profiler's numbers every profileInterval until stop is set, also while a search runs
+def _profileReporter(responses, stop):
+    while not stop.wait(profileInterval):
+        responses.put((0, "profile", Profiler.report()))
+
+def _workerLoop(requests, responses, cancelledId):
+    searcher = Search.Searcher()
+    reporter = None
+    stopReporter = threading.Event()
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        requestId, kind, fen, moveCodes, params = request
+        if cancelledId.value >= requestId:
+            continue
+        if kind == "profile":
+            # params: enable True/False switches Profiler in this process, None just reports
+            if params.get("enable") is True and not Profiler.isEnabled():
+                Profiler.reset()
+                Profiler.enable()
+                stopReporter.clear()
+                reporter = threading.Thread(target = _profileReporter, args = (responses, stopReporter), daemon = True)
+                reporter.start()
+            elif params.get("enable") is False:
+                Profiler.disable()
+                if reporter is not None:
+                    stopReporter.set()
+                    reporter.join()
+                    reporter = None
+            responses.put((requestId, kind, Profiler.report()))
+            continue
+        gs = ChessEngine.GameState.fromFEN(fen)
+        for code in moveCodes:
+            gs.makeMoveCode(code)
+        if kind == "validMoves":
+            codes = list(gs.getValidMoveCodes())
+            responses.put((requestId, kind, (codes, gs.checkMate, gs.staleMate)))
+        elif kind == "bestMove":
+            result = searcher.search(gs, stopEvent = _CancelFlag(requestId, cancelledId), **params)
+            best = result.bestMove.moveId if result.bestMove is not None else None
+            responses.put((requestId, kind, (best, result.score, result.depth, result.nodes)))
+
+
+class EngineWorker():
+    def __init__(self):
+        self.requests = multiprocessing.Queue()
+        self.responses = multiprocessing.Queue()
+        self.cancelledId = multiprocessing.Value("q", 0) # every request up to this id is cancelled
+        self.lastId = 0
+        self.process = multiprocessing.Process(target = _workerLoop,
+            args = (self.requests, self.responses, self.cancelledId), daemon = True)
+        self.process.start()
+
+    '''
+    Queues a request for the position of gs and returns its id.
+    kind is "validMoves" or "bestMove", params go to Searcher.search (timeLimit, maxDepth, ...).
+    kind "profile" (params enable = True/False/None) answers with a Profiler.report() of the worker,
+    while profiling is on more reports (request id 0) follow every profileInterval seconds.
+    '''
+    def request(self, kind, gs, **params):
+        self.lastId += 1
+        self.requests.put((self.lastId, kind, gs.startFEN, list(gs.moveList), params))
+        return self.lastId
+
+    # blocks until the next response arrives, None once the worker is closed
+    def wait(self):
+        return self.responses.get()
+
+    # cancels every request made so far, a running search stops at its next check
+    def cancel(self):
+        with self.cancelledId.get_lock():
+            self.cancelledId.value = self.lastId
+
+    def close(self):
+        self.cancel()
+        self.requests.put(None)
+        self.process.join(timeout = 1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.responses.put(None) # wakes up anyone blocked in wait()
@@ -0,0 +1,272 @@
+'''
+Static evaluation of a GameState in centipawns.
+
+Material and piece-square tables are tapered between a middlegame and an endgame value
+by the amount of non-pawn material left. GameState keeps their sums (mgScore, egScore)
+and the game phase up to date in togglePiece, so only the terms that depend on the
+whole position are computed here: mobility, king safety and pawn structure, the
+latter cached in a PawnHashTable keyed by GameState.pawnKey.
+'''
+from array import array
+
+import Bitboard
+
+# (middlegame, endgame) material
+materialValues = {"p": (82, 94), "N": (337, 281), "B": (365, 297), "R": (477, 512), "Q": (1025, 936), "K": (0, 0)}
+phaseWeights = {"p": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+maxPhase = 24 # all minor and major pieces on the board
+
+# piece-square tables from white's point of view, row 0 is the 8th rank like the board
+_pawnMg = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+     5,  5, 10, 25, 25, 10,  5,  5,
+     0,  0,  0, 20, 20,  0,  0,  0,
+     5, -5,-10,  0,  0,-10, -5,  5,
+     5, 10, 10,-20,-20, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0]
+_pawnEg = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    10, 10, 10, 10, 10, 10, 10, 10,
+     5,  5,  5,  5,  5,  5,  5,  5,
+     0,  0,  0,  0,  0,  0,  0,  0]
+_knight = [
+    -50,-40,-30,-30,-30,-30,-40,-50,
+    -40,-20,  0,  0,  0,  0,-20,-40,
+    -30,  0, 10, 15, 15, 10,  0,-30,
+    -30,  5, 15, 20, 20, 15,  5,-30,
+    -30,  0, 15, 20, 20, 15,  0,-30,
+    -30,  5, 10, 15, 15, 10,  5,-30,
+    -40,-20,  0,  5,  5,  0,-20,-40,
+    -50,-40,-30,-30,-30,-30,-40,-50]
+_bishop = [
+    -20,-10,-10,-10,-10,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5, 10, 10,  5,  0,-10,
+    -10,  5,  5, 10, 10,  5,  5,-10,
+    -10,  0, 10, 10, 10, 10,  0,-10,
+    -10, 10, 10, 10, 10, 10, 10,-10,
+    -10,  5,  0,  0,  0,  0,  5,-10,
+    -20,-10,-10,-10,-10,-10,-10,-20]
+_rook = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0]
+_queen = [
+    -20,-10,-10, -5, -5,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5,  5,  5,  5,  0,-10,
+     -5,  0,  5,  5,  5,  5,  0, -5,
+      0,  0,  5,  5,  5,  5,  0, -5,
+    -10,  5,  5,  5,  5,  5,  0,-10,
+    -10,  0,  5,  0,  0,  0,  0,-10,
+    -20,-10,-10, -5, -5,-10,-10,-20]
+_kingMg = [
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -20,-30,-30,-40,-40,-30,-30,-20,
+    -10,-20,-20,-20,-20,-20,-20,-10,
+     20, 20,  0,  0,  0,  0, 20, 20,
+     20, 30, 10,  0,  0, 10, 30, 20]
+_kingEg = [
+    -50,-40,-30,-20,-20,-30,-40,-50,
+    -30,-20,-10,  0,  0,-10,-20,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-30,  0,  0,  0,  0,-30,-30,
+    -50,-30,-30,-30,-30,-30,-30,-50]
+pieceSquareTables = {"p": (_pawnMg, _pawnEg), "N": (_knight, _knight), "B": (_bishop, _bishop),
+    "R": (_rook, _rook), "Q": (_queen, _queen), "K": (_kingMg, _kingEg)}
+
+'''
+pieceSquare[piece][sq] = (mg, eg, phase) added to the GameState sums when piece is put on sq.
+Material is included, black values are mirrored and negative so the sums are from white's point of view.
+'''
+def _pieceSquare():
+    table = {}
+    for piece, (mgTable, egTable) in pieceSquareTables.items():
+        mgValue, egValue = materialValues[piece]
+        white = [(mgValue + mgTable[sq], egValue + egTable[sq], phaseWeights[piece]) for sq in range(64)]
+        table["w"+piece] = white
+        table["b"+piece] = [(-mg, -eg, phase) for mg, eg, phase in (white[sq ^ 56] for sq in range(64))]
+    return table
+
+pieceSquare = _pieceSquare()
+
+# (middlegame, endgame) per attacked square, centred on a typical number of moves
+mobilityWeights = {"N": (4, 4), "B": (5, 5), "R": (2, 4), "Q": (1, 2)}
+mobilityCentre = {"N": 4, "B": 6, "R": 7, "Q": 13}
+
+# pawn structure (middlegame, endgame)
+doubledPenalty = (10, 20)
+isolatedPenalty = (10, 15)
+passedBonus = [(0, 0), (5, 10), (10, 20), (15, 35), (25, 60), (40, 100), (60, 150), (0, 0)] # by ranks advanced
+
+# king safety, middlegame only
+shieldBonus = 10 # per own pawn in front of a castled king
+attackWeights = {"N": 20, "B": 20, "R": 40, "Q": 80}
+attackScale = [0, 0, 50, 75, 88, 94, 97, 99] # percent, by number of attacking pieces
+
+fileMasks = [sum(1 << (row*8 + col) for row in range(8)) for col in range(8)]
+adjacentFiles = [(fileMasks[col-1] if col > 0 else 0) | (fileMasks[col+1] if col < 7 else 0) for col in range(8)]
+
+def _passedMasks(color):
+    # squares in front of a pawn on its own and the adjacent files
+    masks = []
+    for sq in range(64):
+        row, col = Bitboard.rowCol(sq)
+        rows = range(row) if color == "w" else range(row + 1, 8)
+        masks.append(sum(1 << (r*8 + c) for r in rows for c in (col-1, col, col+1) if 0 <= c < 8))
+    return masks
+
+passedMasks = {"w": _passedMasks("w"), "b": _passedMasks("b")}
+
+
+class PawnHashTable():
+    '''
+    Pawn structure scores by pawn key. One (mg, eg) entry per slot, a store always replaces.
+    '''
+    def __init__(self, entries = 1 << 14):
+        self.entries = entries
+        self.clear()
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * self.entries))
+        self.mg = array("i", bytes(4 * self.entries))
+        self.eg = array("i", bytes(4 * self.entries))
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        index = key % self.entries
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.mg[index], self.eg[index]
+        self.misses += 1
+        return None
+
+    def store(self, key, mg, eg):
+        index = key % self.entries
+        self.keys[index] = key
+        self.mg[index] = mg
+        self.eg[index] = eg
+
+
+class Evaluator():
+    def __init__(self, pawnEntries = 1 << 14):
+        self.pawnTable = PawnHashTable(pawnEntries)
+
+    '''
+    Score of gs from the side to move's point of view.
+    '''
+    def evaluate(self, gs):
+        mg, eg = gs.mgScore, gs.egScore
+        pawns = self.pawnTable.probe(gs.pawnKey)
+        if pawns is None:
+            pawns = pawnStructure(gs.bitboards["wp"], gs.bitboards["bp"])
+            self.pawnTable.store(gs.pawnKey, *pawns)
+        mg += pawns[0]
+        eg += pawns[1]
+        mobility = mobilityAndKingSafety(gs)
+        mg += mobility[0]
+        eg += mobility[1]
+        phase = min(gs.phase, maxPhase)
+        score = (mg * phase + eg * (maxPhase - phase)) // maxPhase
+        return score if gs.whiteToMove else -score
+
+
+# material and piece-square sums from scratch, GameState keeps them up to date incrementally
+def computeScores(board):
+    mg = eg = phase = 0
+    for row in range(8):
+        for col in range(8):
+            if board[row][col] != "--":
+                pieceMg, pieceEg, piecePhase = pieceSquare[board[row][col]][row*8 + col]
+                mg += pieceMg
+                eg += pieceEg
+                phase += piecePhase
+    return mg, eg, phase
+
+# doubled, isolated and passed pawns, (mg, eg) from white's point of view
+def pawnStructure(whitePawns, blackPawns):
+    mg = eg = 0
+    for color, own, enemy, sign in (("w", whitePawns, blackPawns, 1), ("b", blackPawns, whitePawns, -1)):
+        for col in range(8):
+            count = Bitboard.popCount(own & fileMasks[col])
+            if count > 1:
+                mg -= sign * doubledPenalty[0] * (count - 1)
+                eg -= sign * doubledPenalty[1] * (count - 1)
+            if count and not own & adjacentFiles[col]:
+                mg -= sign * isolatedPenalty[0] * count
+                eg -= sign * isolatedPenalty[1] * count
+        for sq in Bitboard.squares(own):
+            if not enemy & passedMasks[color][sq]:
+                advanced = 6 - (sq >> 3) if color == "w" else (sq >> 3) - 1
+                mg += sign * passedBonus[advanced + 1][0]
+                eg += sign * passedBonus[advanced + 1][1]
+    return mg, eg
+
+'''
+Mobility of knights, bishops, rooks and queens (squares attacked that are not own pieces)
+and king safety: the pawn shield and the pieces attacking the squares around each king.
+Returns (mg, eg) from white's point of view.
+'''
+def mobilityAndKingSafety(gs):
+    bb = gs.bitboards
+    occupied = gs.occupied
+    mg = eg = 0
+    for color, enemy, own, sign in (("w", "b", gs.whitePieces, 1), ("b", "w", gs.blackPieces, -1)):
+        enemyKing = bb[enemy+"K"]
+        kingSq = enemyKing.bit_length() - 1
+        kingZone = Bitboard.kingAttacks[kingSq] | enemyKing
+        attackers = attack = 0
+        for piece in "NBRQ":
+            mgWeight, egWeight = mobilityWeights[piece]
+            centre = mobilityCentre[piece]
+            for sq in Bitboard.squares(bb[color+piece]):
+                if piece == "N":
+                    attacks = Bitboard.knightAttacks[sq]
+                elif piece == "B":
+                    attacks = Bitboard.bishopAttacks(sq, occupied)
+                elif piece == "R":
+                    attacks = Bitboard.rookAttacks(sq, occupied)
+                else:
+                    attacks = Bitboard.queenAttacks(sq, occupied)
+                moves = Bitboard.popCount(attacks & ~own) - centre
+                mg += sign * mgWeight * moves
+                eg += sign * egWeight * moves
+                if attacks & kingZone:
+                    attackers += 1
+                    attack += attackWeights[piece] * Bitboard.popCount(attacks & kingZone)
+        # the enemy king is in danger from this side's pieces
+        mg += sign * attack * attackScale[min(attackers, 7)] // 100
+        mg -= sign * kingShield(bb, enemy, kingSq)
+    return mg, eg
+
+# score of the pawns in front of color's king on sq, only for a king on its back two ranks
+def kingShield(bb, color, sq):
+    row, col = Bitboard.rowCol(sq)
+    if color == "w" and row < 6 or color == "b" and row > 1:
+        return 0
+    step = -1 if color == "w" else 1
+    shield = 0
+    for c in (col-1, col, col+1):
+        if 0 <= c < 8:
+            shield |= Bitboard.bit(row + step, c)
+            if 0 <= row + 2*step < 8:
+                shield |= Bitboard.bit(row + 2*step, c)
+    return shieldBonus * Bitboard.popCount(bb[color+"p"] & shield)
@@ -0,0 +1,466 @@
+'''
+Self-play matches: many games in parallel on a pool of worker processes.
+
+Each player is this tree's engine ("engine"), a random mover ("random") or an external
+UCI engine ("uci:COMMAND", e.g. another build's UCI.py), each with its own time control.
+Two builds are compared by running one of them as a UCI command, player 1 by default is
+the engine of this tree. Every opening is played twice with the colors swapped. Finished games are
+appended to a compact log (one tab separated line per game) and an existing log is
+resumed: its games are counted and only the missing ones are played.
+
+    python Match.py --games 200 --tc 5+0.05 --player2 random --log match.log
+    python Match.py --games 1000 --tc movetime=0.1 --tc2 movetime=0.05 --openings openings.epd
+    python Match.py --games 1000 --tc 10+0.1 --player2 "uci:python ../baseline/UCI.py"
+
+Time controls are "base+increment" in seconds, "movetime=S", "nodes=N" or "depth=D".
+'''
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import queue
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import ChessEngine
+import EPD
+import Search
+import UCI
+
+# base and increment in seconds (clock), or a fixed moveTime / nodes / depth per move
+TimeControl = namedtuple("TimeControl", ["base", "increment", "moveTime", "nodes", "depth"])
+TimeControl.__new__.__defaults__ = (None,) * 5
+# kind is "engine", "random" or "uci" (command is then the engine's command line)
+Player = namedtuple("Player", ["kind", "timeControl", "hashMB", "command"])
+Player.__new__.__defaults__ = (None,)
+# player1White tells which color player 1 has, seed drives the random mover
+GameSpec = namedtuple("GameSpec", ["gameId", "fen", "player1White", "player1", "player2", "maxPlies", "seed"])
+# result is "1-0", "0-1" or "1/2-1/2", nodes and seconds are the engines' totals, moves in UCI notation
+GameRecord = namedtuple("GameRecord", ["gameId", "result", "reason", "plies", "nodes", "seconds", "moves"])
+
+logHeader = "# match "
+z95 = 1.959964 # two sided 95% normal quantile
+uciGrace = 5.0 # seconds an external engine may take beyond its budget before it loses
+uciNoBudget = 600.0 # seconds to wait for a depth or nodes limited move
+
+
+class PlayerError(Exception):
+    pass
+
+# "engine", "random" or "uci:COMMAND"
+def parsePlayer(text, timeControl, hashMB):
+    if text in ("engine", "random"):
+        return Player(text, timeControl, hashMB)
+    if text.startswith("uci:") and text[4:].strip():
+        return Player("uci", timeControl, hashMB, text[4:].strip())
+    raise ValueError("unknown player: " + text)
+
+
+def parseTimeControl(text):
+    if "=" in text:
+        name, value = text.split("=", 1)
+        if name == "movetime":
+            return TimeControl(moveTime = float(value))
+        if name in ("nodes", "depth"):
+            return TimeControl(**{name: int(value)})
+        raise ValueError("unknown time control: " + text)
+    base, _, increment = text.partition("+")
+    return TimeControl(base = float(base), increment = float(increment or 0))
+
+# three folds, fifty moves, checkmate, stalemate or mating material gone; None while the game goes on
+def gameOver(gs, hasMoves):
+    if not hasMoves:
+        if gs.inCheck():
+            return ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if gs.isRepetition():
+        return "1/2-1/2", "repetition"
+    if gs.isFiftyMoveRule():
+        return "1/2-1/2", "fifty moves"
+    if insufficientMaterial(gs):
+        return "1/2-1/2", "insufficient material"
+    return None
+
+# only kings and at most one minor piece left
+def insufficientMaterial(gs):
+    pieces = [piece[1] for row in gs.board for piece in row if piece != "--" and piece[1] != "K"]
+    return not pieces or (len(pieces) == 1 and pieces[0] in "NB")
+
+
+class UCIPlayer():
+    '''
+    An external engine speaking UCI, run as a child process of the match worker.
+    Lines are read by a thread so a silent engine can be timed out.
+    '''
+    def __init__(self, command, hashMB):
+        self.process = subprocess.Popen(shlex.split(command), stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+            stderr = subprocess.DEVNULL, text = True, bufsize = 1)
+        self.lines = queue.Queue()
+        threading.Thread(target = self.readLines, daemon = True).start()
+        self.send("uci")
+        self.waitFor("uciok", uciGrace)
+        self.send("setoption name Hash value %d" % hashMB)
+
+    def readLines(self):
+        for line in self.process.stdout:
+            self.lines.put(line.strip())
+        self.lines.put(None)
+
+    def send(self, line):
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            raise PlayerError("uci engine exited")
+
+    # the lines read up to and including the first one starting with prefix
+    def waitFor(self, prefix, timeout):
+        deadline = time.perf_counter() + timeout
+        lines = []
+        while True:
+            try:
+                line = self.lines.get(timeout = max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                raise PlayerError("uci engine did not answer")
+            if line is None:
+                raise PlayerError("uci engine exited")
+            lines.append(line)
+            if line.startswith(prefix):
+                return lines
+
+    def newGame(self):
+        self.send("ucinewgame")
+        self.send("isready")
+        self.waitFor("readyok", uciGrace)
+
+    # (UCI move text, nodes from the last info line)
+    def bestMove(self, fen, moves, goArguments, timeout):
+        self.send("position fen " + fen + (" moves " + " ".join(moves) if moves else ""))
+        self.send("go " + goArguments)
+        lines = self.waitFor("bestmove", timeout)
+        nodes = 0
+        for line in lines:
+            tokens = line.split()
+            if tokens[:1] == ["info"] and tokens[1:2] != ["string"] and "nodes" in tokens[:-1]:
+                nodes = int(tokens[tokens.index("nodes") + 1])
+        fields = lines[-1].split()
+        if len(fields) < 2:
+            raise PlayerError("uci engine sent no move")
+        return fields[1], nodes
+
+    def close(self):
+        try:
+            self.send("quit")
+            self.process.wait(timeout = 1)
+        except (PlayerError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+# worker process state: one Searcher or UCIPlayer per player so they do not share a transposition table
+_searchers = {}
+_uciPlayers = {}
+
+def _searcherFor(index, player):
+    if index not in _searchers:
+        _searchers[index] = Search.Searcher(player.hashMB)
+    return _searchers[index]
+
+def _uciPlayerFor(index, player):
+    if index not in _uciPlayers:
+        _uciPlayers[index] = UCIPlayer(player.command, player.hashMB)
+    return _uciPlayers[index]
+
+# a misbehaving engine is restarted for the next game
+def _dropUCIPlayer(index):
+    uciPlayer = _uciPlayers.pop(index, None)
+    if uciPlayer is not None:
+        uciPlayer.close()
+
+'''
+Plays one game in the worker, returns a GameRecord. A clock that runs out loses the game,
+so does an illegal, missing or late move of an external engine.
+'''
+def playGame(spec):
+    gs = ChessEngine.GameState.fromFEN(spec.fen)
+    rng = random.Random(spec.seed)
+    players = {spec.player1White: (1, spec.player1), not spec.player1White: (2, spec.player2)}
+    clocks = {}
+    for white in (True, False):
+        timeControl = players[white][1].timeControl
+        if timeControl.base is not None:
+            clocks[white] = timeControl.base
+    nodes = 0
+    seconds = 0.0
+    moves = []
+    def record(result, reason):
+        return GameRecord(spec.gameId, result, reason, len(moves), nodes, seconds, " ".join(moves))
+    lost = {True: "0-1", False: "1-0"} # result when white (True) or black loses
+    for white, (index, player) in players.items():
+        try:
+            if player.kind == "engine":
+                _searcherFor(index, player).tt.clear()
+            elif player.kind == "uci":
+                _uciPlayerFor(index, player).newGame()
+        except (PlayerError, OSError) as error:
+            _dropUCIPlayer(index)
+            return record(lost[white], str(error))
+    while True:
+        codes = gs.getValidMoveCodes()
+        over = gameOver(gs, len(codes) > 0)
+        if over is None and len(moves) >= spec.maxPlies:
+            over = "1/2-1/2", "adjudicated"
+        if over is not None:
+            return record(*over)
+        white = gs.whiteToMove
+        index, player = players[white]
+        if player.kind == "random":
+            move = ChessEngine.Move.fromId(rng.choice(codes), gs.board)
+        else:
+            start = time.perf_counter()
+            try:
+                if player.kind == "engine":
+                    result = _searcherFor(index, player).search(gs, **searchLimits(player.timeControl, clocks, white))
+                    move, moveNodes = result.bestMove, result.nodes
+                else:
+                    text, moveNodes = _uciPlayerFor(index, player).bestMove(spec.fen, moves,
+                        goArguments(player.timeControl, clocks, white), uciTimeout(player.timeControl, clocks, white))
+                    try:
+                        move = UCI.moveFromUCI(gs, text)
+                    except ValueError:
+                        raise PlayerError("illegal move " + text)
+            except (PlayerError, OSError) as error:
+                _dropUCIPlayer(index)
+                return record(lost[white], str(error))
+            elapsed = time.perf_counter() - start
+            nodes += moveNodes
+            seconds += elapsed
+            if white in clocks:
+                clocks[white] += player.timeControl.increment - elapsed
+                if clocks[white] < 0:
+                    return record(lost[white], "time forfeit")
+        moves.append(UCI.uciMove(move))
+        gs.makeMove(move)
+
+# Searcher.search keyword arguments, clock based budgets use the UCI time allocation
+def searchLimits(timeControl, clocks, whiteToMove):
+    if timeControl.moveTime is not None:
+        return {"timeLimit": timeControl.moveTime}
+    if timeControl.nodes is not None:
+        return {"nodeLimit": timeControl.nodes}
+    if timeControl.depth is not None:
+        return {"maxDepth": timeControl.depth}
+    color = "w" if whiteToMove else "b"
+    params = {color + "time": clocks[whiteToMove] * 1000, color + "inc": timeControl.increment * 1000}
+    return {"timeLimit": UCI.timeForMove(params, whiteToMove)}
+
+# the go command's arguments for an external engine, times in milliseconds
+def goArguments(timeControl, clocks, whiteToMove):
+    if timeControl.moveTime is not None:
+        return "movetime %d" % (timeControl.moveTime * 1000)
+    if timeControl.nodes is not None:
+        return "nodes %d" % timeControl.nodes
+    if timeControl.depth is not None:
+        return "depth %d" % timeControl.depth
+    arguments = []
+    for white, color in ((True, "w"), (False, "b")):
+        if white in clocks:
+            arguments.append("%stime %d" % (color, max(clocks[white], 0) * 1000))
+            if white == whiteToMove:
+                arguments.append("%sinc %d" % (color, timeControl.increment * 1000))
+    return " ".join(arguments)
+
+def uciTimeout(timeControl, clocks, whiteToMove):
+    if timeControl.moveTime is not None:
+        return timeControl.moveTime + uciGrace
+    if whiteToMove in clocks:
+        return clocks[whiteToMove] + uciGrace
+    return uciNoBudget
+
+
+'''
+Opening FENs: the positions of an EPD (or one FEN per line) file, else the start position,
+followed by randomPlies random moves. Positions that end during the random moves are redrawn.
+'''
+def makeOpenings(count, path = None, randomPlies = 0, seed = 0):
+    if path:
+        with open(path) as f:
+            bases = [_openingFEN(line) for line in f if line.strip() and not line.startswith("#")]
+    else:
+        bases = [ChessEngine.startFEN]
+    openings = []
+    rng = random.Random(seed)
+    while len(openings) < count:
+        gs = ChessEngine.GameState.fromFEN(bases[len(openings) % len(bases)])
+        for _ in range(randomPlies):
+            codes = gs.getValidMoveCodes()
+            if not codes:
+                break
+            gs.makeMoveCode(rng.choice(codes))
+        if gameOver(gs, len(gs.getValidMoveCodes()) > 0) is None:
+            openings.append(gs.toFEN())
+    return openings
+
+def _openingFEN(line):
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return " ".join(fields[:6])
+    return EPD.parseEPD(line)[0].toFEN()
+
+
+def formatRecord(record):
+    return "\t".join(str(value) for value in record)
+
+def parseRecord(line):
+    gameId, result, reason, plies, nodes, seconds, moves = line.rstrip("\n").split("\t")
+    return GameRecord(int(gameId), result, reason, int(plies), int(nodes), float(seconds), moves)
+
+'''
+Reads a match log, returns (config, {gameId: GameRecord}).
+A partly written last line (an interrupted run) is ignored.
+'''
+def readLog(path):
+    config = None
+    records = {}
+    with open(path) as f:
+        for line in f:
+            if line.startswith(logHeader):
+                config = json.loads(line[len(logHeader):])
+            elif line.endswith("\n") and line.strip():
+                record = parseRecord(line)
+                records[record.gameId] = record
+    return config, records
+
+# cuts an interrupted last line off so appended games start on a line of their own
+def dropPartialLine(path):
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+# score of player 1 (1 win, 0.5 draw) in a game
+def player1Score(record):
+    if record.result == "1/2-1/2":
+        return 0.5
+    player1White = record.gameId % 2 == 0
+    return 1.0 if (record.result == "1-0") == player1White else 0.0
+
+def eloFromScore(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+Stats = namedtuple("Stats", ["games", "wins", "draws", "losses", "elo", "eloLow", "eloHigh"])
+
+'''
+Player 1's results and Elo difference with a 95% confidence interval from the per game score variance.
+'''
+def matchStats(records):
+    scores = [player1Score(record) for record in records]
+    games = len(scores)
+    wins, draws = scores.count(1.0), scores.count(0.5)
+    if not games:
+        return Stats(0, 0, 0, 0, 0.0, -math.inf, math.inf)
+    mean = sum(scores) / games
+    deviation = math.sqrt(sum((score - mean) ** 2 for score in scores) / games)
+    margin = z95 * deviation / math.sqrt(games)
+    return Stats(games, wins, draws, games - wins - draws, eloFromScore(mean),
+        eloFromScore(mean - margin), eloFromScore(mean + margin))
+
+def formatStats(stats):
+    errorBar = (stats.eloHigh - stats.eloLow) / 2 if math.isfinite(stats.eloHigh - stats.eloLow) else math.inf
+    return "+%d =%d -%d  elo %+.1f +- %.1f" % (stats.wins, stats.draws, stats.losses, stats.elo, errorBar)
+
+
+'''
+Plays the games missing from the log (all of them for a new log) and returns their Stats.
+progress, if given, is called with a text line after every game.
+'''
+def runMatch(config, logPath, processes = None, progress = None):
+    records = {}
+    if os.path.exists(logPath):
+        oldConfig, records = readLog(logPath)
+        dropPartialLine(logPath)
+        if oldConfig is not None and oldConfig != config:
+            raise ValueError("%s was written by a match with other settings" % logPath)
+    player1 = parsePlayer(config["player1"], parseTimeControl(config["tc"]), config["hash"])
+    player2 = parsePlayer(config["player2"], parseTimeControl(config["tc2"] or config["tc"]), config["hash"])
+    openings = makeOpenings((config["games"] + 1) // 2, config["openings"], config["randomPlies"], config["seed"])
+    specs = [GameSpec(gameId, openings[gameId // 2], gameId % 2 == 0, player1, player2, config["maxPlies"],
+        config["seed"] * 1000003 + gameId) for gameId in range(config["games"]) if gameId not in records]
+
+    played = []
+    start = time.perf_counter()
+    with open(logPath, "a") as log:
+        if not records:
+            log.write(logHeader + json.dumps(config) + "\n")
+            log.flush()
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(playGame, spec) for spec in specs]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    record = future.result()
+                    log.write(formatRecord(record) + "\n")
+                    log.flush()
+                    records[record.gameId] = record
+                    played.append(record)
+                    if progress is not None:
+                        progress(progressLine(records, played, time.perf_counter() - start))
+            except BaseException:
+                # interrupted: the log holds every finished game, the rest is played on resume
+                for future in futures:
+                    future.cancel()
+                raise
+    return matchStats(records.values())
+
+def progressLine(records, played, seconds):
+    last = played[-1]
+    nodes = sum(record.nodes for record in played)
+    engineSeconds = sum(record.seconds for record in played)
+    return "game %d %s %-21s %s  %.2f games/s  %.0f nodes/s" % (last.gameId, last.result, "(%s)" % last.reason,
+        formatStats(matchStats(records.values())), len(played) / seconds if seconds else 0.0,
+        nodes / engineSeconds if engineSeconds else 0.0)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Self-play match between two players, scores are player 1's")
+    parser.add_argument("--games", type = int, default = 100, help = "number of games (default 100)")
+    parser.add_argument("--player1", default = "engine", help = "engine, random or uci:COMMAND (default engine)")
+    parser.add_argument("--player2", default = "engine", help = "opponent, engine, random or uci:COMMAND (default engine)")
+    parser.add_argument("--tc", default = "movetime=0.1", help = "time control of player 1 (default movetime=0.1)")
+    parser.add_argument("--tc2", help = "time control of player 2 (default --tc)")
+    parser.add_argument("--openings", metavar = "FILE", help = "EPD or FEN per line opening positions")
+    parser.add_argument("--random-plies", type = int, help = "random moves after the opening (default 4 without --openings)")
+    parser.add_argument("--max-plies", type = int, default = 300, help = "adjudicate a draw after this many plies")
+    parser.add_argument("--hash", type = int, default = 16, help = "transposition table size in MB per engine")
+    parser.add_argument("--seed", type = int, default = 1, help = "random seed of openings and random mover")
+    parser.add_argument("--processes", type = int, help = "worker processes (default cpu count)")
+    parser.add_argument("--log", default = "match.log", help = "game log, resumed if it exists (default match.log)")
+    args = parser.parse_args(argv)
+
+    randomPlies = args.random_plies if args.random_plies is not None else (0 if args.openings else 4)
+    config = {"games": args.games, "player1": args.player1, "player2": args.player2, "tc": args.tc, "tc2": args.tc2,
+        "openings": args.openings, "randomPlies": randomPlies, "maxPlies": args.max_plies, "hash": args.hash, "seed": args.seed}
+    start = time.perf_counter()
+    try:
+        stats = runMatch(config, args.log, args.processes, progress = print)
+    except ValueError as error:
+        print(error)
+        return 2
+    except KeyboardInterrupt:
+        print("\ninterrupted, run again with the same --log to resume")
+        return 1
+    print("\n%d games in %.1fs: %s" % (stats.games, time.perf_counter() - start, formatStats(stats)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+'''
+Streaming PGN reading and game replay.
+
+    for game in readGames("games.pgn"):
+        for move, gs in replay(game):
+            ...
+
+Games are parsed one at a time so memory use does not grow with the file size.
+replayFile spreads the replay of a file over worker processes, every worker
+reads its own byte range of the file, and returns the results in file order.
+'''
+import multiprocessing
+import os
+import re
+from collections import deque
+
+import ChessEngine
+
+results = ("1-0", "0-1", "1/2-1/2", "*")
+_headerRegex = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+_moveNumberRegex = re.compile(r"^\d+\.+")
+chunksPerProcess = 2 # chunks handed to the pool ahead of the one being consumed, per worker
+
+
+class Game():
+    __slots__ = ("headers", "moves", "result")
+
+    def __init__(self, headers, moves, result):
+        self.headers = headers # {"White": ..., "FEN": ...}
+        self.moves = moves # SAN strings of the main line
+        self.result = result
+
+    def startPosition(self):
+        if "FEN" in self.headers:
+            return ChessEngine.GameState.fromFEN(self.headers["FEN"])
+        return ChessEngine.GameState()
+
+
+'''
+Yields a Game for every game in source, a path or any iterable of lines.
+'''
+def readGames(source):
+    if isinstance(source, str):
+        with open(source, encoding = "utf-8", errors = "replace") as f:
+            yield from readGames(f)
+        return
+    headers = {}
+    movetext = []
+    for line in source:
+        line = line.strip()
+        if line.startswith("[") and not line.startswith("[%"):
+            # a tag after movetext starts the next game
+            if movetext:
+                yield parseGame(headers, movetext)
+                headers, movetext = {}, []
+            match = _headerRegex.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+        elif line and not line.startswith("%"):
+            movetext.append(line)
+    if headers or movetext:
+        yield parseGame(headers, movetext)
+
+def parseGame(headers, movetext):
+    moves = []
+    result = headers.get("Result", "*")
+    for token in tokenize("\n".join(movetext)):
+        if token in results:
+            result = token
+        else:
+            moves.append(token)
+    return Game(headers, moves, result)
+
+'''
+SAN tokens of the main line: comments, variations, NAGs and move numbers are dropped.
+'''
+def tokenize(text):
+    depth = 0 # variation nesting
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "{":
+            end = text.find("}", i)
+            i = len(text) if end < 0 else end + 1
+            continue
+        if char == ";": # comment to the end of the line
+            end = text.find("\n", i)
+            i = len(text) if end < 0 else end + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif not char.isspace():
+            end = i
+            while end < len(text) and not text[end].isspace() and text[end] not in "{}();":
+                end += 1
+            token = _moveNumberRegex.sub("", text[i:end])
+            i = end
+            if depth == 0 and token and not token.startswith("$"):
+                yield token
+            continue
+        i += 1
+
+'''
+Replays the game on a live GameState, yielding (Move, GameState) after each move is made.
+The same GameState is yielded every time, copy what you need before advancing.
+Raises ValueError on an illegal or unreadable move.
+'''
+def replay(game, gs = None):
+    if gs is None:
+        gs = game.startPosition()
+    for san in game.moves:
+        move = gs.moveFromSAN(san)
+        gs.makeMove(move)
+        yield move, gs
+
+# SAN of a whole game given as Move objects, played from gs (the start position by default)
+def movesToSAN(moves, gs = None):
+    if gs is None:
+        gs = ChessEngine.GameState()
+    sans = []
+    for move in moves:
+        sans.append(gs.getSAN(move))
+        gs.makeMove(move)
+    for _ in moves:
+        gs.undoMove()
+    return sans
+
+def writeGame(headers, sans, result = "*"):
+    lines = ['[%s "%s"]' % (key, str(value).replace('"', '\\"')) for key, value in headers.items()]
+    text = ""
+    for i, san in enumerate(sans):
+        text += ("%d. " % (i // 2 + 1) if i % 2 == 0 else "") + san + " "
+    return "\n".join(lines) + "\n\n" + text + result + "\n"
+
+
+'''
+Byte offsets where games start: the top of the file (whether the first game has tags or not)
+and the first tag line after movetext.
+'''
+def gameOffsets(path):
+    yield 0
+    offset = 0
+    inMovetext = False
+    with open(path, "rb") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith(b"[") and not stripped.startswith(b"[%"):
+                if inMovetext:
+                    yield offset
+                inMovetext = False
+            elif stripped:
+                inMovetext = True
+            offset += len(line)
+
+def _chunks(path, gamesPerChunk, function):
+    starts = []
+    for offset in gameOffsets(path):
+        starts.append(offset)
+        if len(starts) > gamesPerChunk:
+            yield path, starts[0], starts[-1], function
+            starts = starts[-1:]
+    if starts:
+        yield path, starts[0], None, function
+
+def _replayChunk(args):
+    path, start, end, function = args
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    lines = data.decode("utf-8", errors = "replace").splitlines()
+    return [applyToGame(function, game) for game in readGames(lines)]
+
+# games that fail to replay give None
+def applyToGame(function, game):
+    try:
+        return function(game)
+    except ValueError:
+        return None
+
+'''
+Calls function(game) for every game of the PGN file and yields the results in file order.
+function must be a module level function so it can be sent to the worker processes,
+it usually replays the game with replay(game). With processes=1 everything runs in this process.
+Only chunksPerProcess chunks per worker are submitted ahead of the consumer, so memory
+stays bounded however large the file is and however slowly the results are used.
+'''
+def replayFile(path, function, processes = None, gamesPerChunk = 256):
+    if processes == 1:
+        for game in readGames(path):
+            yield applyToGame(function, game)
+        return
+    window = chunksPerProcess * (processes or os.cpu_count() or 1)
+    with multiprocessing.Pool(processes) as pool:
+        pending = deque()
+        for chunk in _chunks(path, gamesPerChunk, function):
+            pending.append(pool.apply_async(_replayChunk, (chunk,)))
+            if len(pending) >= window:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+# example function for replayFile: FEN of every position of the game
+def gameFENs(game):
+    return [gs.toFEN() for move, gs in replay(game)]
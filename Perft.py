@@ -0,0 +1,193 @@
+'''
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+Used both as a correctness check against known counts and as a speed benchmark
+of getValidMoves/makeMove/undoMove.
+
+    python Perft.py                              # reference suite
+    python Perft.py --fen "<fen>" --depth 4 --divide
+    python Perft.py --save-baseline perft.json   # record nodes/sec
+    python Perft.py --baseline perft.json --threshold 10
+    python Perft.py --fen "<fen>" --depth 5 --processes 8   # root moves split over processes
+'''
+import argparse
+import json
+import sys
+import time
+
+import ChessEngine
+
+startFEN = ChessEngine.startFEN
+
+# (name, fen, {depth: leaf count}) from the chessprogramming wiki perft results
+# and the well known en passant / castling / promotion edge case positions
+referencePositions = [
+    ("start", startFEN,
+        {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        {1: 48, 2: 2039, 3: 97862}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        {1: 6, 2: 264, 3: 9467}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        {1: 44, 2: 1486, 3: 62379}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        {1: 46, 2: 2079, 3: 89890}),
+    ("illegal ep move 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", {6: 1134888}),
+    ("illegal ep move 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", {6: 1015133}),
+    ("ep capture checks opponent", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", {6: 1440467}),
+    ("short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", {6: 661072}),
+    ("long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", {6: 803711}),
+    ("castle rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", {4: 1274206}),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", {4: 1720476}),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", {6: 3821001}),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", {5: 1004658}),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", {6: 217342}),
+    ("underpromote to check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", {6: 92683}),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", {6: 2217}),
+    ("stalemate and checkmate 1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", {7: 567584}),
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {4: 23527}),
+]
+
+
+# leaf count, the last ply is counted from the move list without making the moves
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoveCodes()
+    if depth == 1:
+        return len(moves)
+    leaves = 0
+    for move in moves:
+        gs.makeMoveCode(move)
+        leaves += perft(gs, depth - 1)
+        gs.undoMove()
+    return leaves
+
+# leaf count per root move
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+'''
+Runs perft for every depth up to depth and returns one report per depth:
+{"depth", "leaves", "seconds", "nps"}
+'''
+def perftReport(fen, depth):
+    reports = []
+    for d in range(1, depth + 1):
+        gs = ChessEngine.GameState.fromFEN(fen)
+        start = time.perf_counter()
+        leaves = perft(gs, d)
+        seconds = time.perf_counter() - start
+        reports.append({"depth": d, "leaves": leaves, "seconds": seconds, "nps": leaves / seconds if seconds else 0.0})
+    return reports
+
+
+def runSuite(maxDepth = None):
+    results = {}
+    failures = 0
+    for name, fen, expected in referencePositions:
+        depths = [d for d in expected if maxDepth is None or d <= maxDepth]
+        if not depths:
+            continue
+        depth = max(depths)
+        report = perftReport(fen, depth)
+        results[name] = report
+        for line in report:
+            want = expected.get(line["depth"])
+            status = "" if want is None else ("ok" if want == line["leaves"] else "FAIL expected %d" % want)
+            if status.startswith("FAIL"):
+                failures += 1
+            printLine(name, line, status)
+    return results, failures
+
+def printLine(name, line, status = ""):
+    print("%-28s depth %d  %12d leaves  %8.3fs  %10.0f nodes/s  %s" %
+        (name, line["depth"], line["leaves"], line["seconds"], line["nps"], status))
+
+'''
+Compares nodes/sec of results against a saved baseline.
+Returns the (name, depth, old nps, new nps) entries that are slower by more than threshold percent.
+Depths that ran for less than minSeconds are too noisy to compare.
+'''
+def findRegressions(results, baseline, threshold, minSeconds = 0.05):
+    regressions = []
+    for name, report in results.items():
+        old = {line["depth"]: line for line in baseline.get(name, [])}
+        for line in report:
+            before = old.get(line["depth"])
+            if before is None or before["seconds"] < minSeconds or line["seconds"] < minSeconds:
+                continue
+            if line["nps"] < before["nps"] * (1 - threshold / 100):
+                regressions.append((name, line["depth"], before["nps"], line["nps"]))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Perft correctness and speed check")
+    parser.add_argument("--fen", help = "position to run instead of the reference suite")
+    parser.add_argument("--depth", type = int, help = "maximum depth")
+    parser.add_argument("--divide", action = "store_true", help = "leaf count per root move")
+    parser.add_argument("--save-baseline", metavar = "FILE", help = "write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar = "FILE", help = "compare nodes/sec against a JSON baseline")
+    parser.add_argument("--threshold", type = float, default = 10.0, help = "allowed slowdown in percent (default 10)")
+    parser.add_argument("--processes", type = int, help = "split the root moves of --fen over this many processes")
+    parser.add_argument("--profile", metavar = "FILE", help = "instrument GameState and write the report as JSON")
+    args = parser.parse_args(argv)
+    if args.profile:
+        import Profiler
+        Profiler.enable()
+
+    failures = 0
+    if args.fen:
+        depth = args.depth or 3
+        if args.divide:
+            counts = divide(ChessEngine.GameState.fromFEN(args.fen), depth)
+            for notation in sorted(counts):
+                print("%s: %d" % (notation, counts[notation]))
+            print("\nmoves: %d  leaves: %d" % (len(counts), sum(counts.values())))
+            return 0
+        if args.processes:
+            import Analysis
+            with Analysis.AnalysisPool(args.processes) as pool:
+                start = time.perf_counter()
+                leaves, counts = pool.perft(ChessEngine.GameState.fromFEN(args.fen), depth)
+                seconds = time.perf_counter() - start
+            printLine("fen", {"depth": depth, "leaves": leaves, "seconds": seconds, "nps": leaves / seconds})
+            return 0
+        results = {"fen": perftReport(args.fen, depth)}
+        for line in results["fen"]:
+            printLine("fen", line)
+    else:
+        results, failures = runSuite(args.depth)
+        print("\n%d mismatching counts" % failures)
+
+    exitCode = 1 if failures else 0
+    if args.profile:
+        Profiler.disable()
+        Profiler.save(args.profile)
+        print()
+        for line in Profiler.summary(top = 10):
+            print(line)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = findRegressions(results, baseline, args.threshold)
+        for name, depth, before, after in regressions:
+            print("REGRESSION %s depth %d: %.0f -> %.0f nodes/s (%.1f%%)" %
+                (name, depth, before, after, 100 * (after - before) / before))
+        if regressions:
+            exitCode = 1
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent = 1)
+    return exitCode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+'''
+Optional instrumentation of GameState's hot paths.
+
+enable() replaces the methods below on the GameState class with counting and timing
+wrappers, disable() puts the originals back, so nothing is measured (or slowed down)
+while it is off. Per-piece generators are reached through each GameState's switcher,
+which holds bound methods: GameStates created before enable() have to be passed to it.
+
+    Profiler.enable(gs)
+    Perft.perft(gs, 4)
+    Profiler.disable()
+    Profiler.save("profile.json")
+'''
+import json
+import time
+
+import ChessEngine
+
+methods = ["getValidMoves", "getValidMoveCodes", "getAllPossibleMoves", "getAllPossibleMoveCodes",
+    "getCaptureMoveCodes", "getQuietMoveCodes", "filterLegal", "isLegal", "isPseudoLegal",
+    "getChecksAndPins", "squareUnderAttack", "attackersTo", "makeMove", "makeMoveCode", "undoMove"]
+# generators: the time spent producing their moves, one call per generator
+generatorMethods = ["getStagedMoveCodes"]
+# set-wise generation of several piece types at once, moves are counted per piece from the result
+byKindGenerators = ["getPossibleMoveCodesByKind"]
+pieceGenerators = {"p": "getPawnMoves", "R": "getRookMoves", "B": "getBishopMoves",
+    "N": "getKnightMoves", "K": "getKingMoves", "Q": "getQueenMoves"}
+histogramBuckets = 16 # bucket i counts calls of under 2**i microseconds, the last one everything slower
+
+_originals = {}
+_gameStates = []
+stats = {} # method name -> [calls, seconds, histogram]
+movesPerPiece = {} # piece -> moves generated
+startTime = None
+stopTime = None
+
+
+def isEnabled():
+    return bool(_originals)
+
+def reset():
+    global startTime, stopTime
+    stats.clear()
+    movesPerPiece.clear()
+    for name in methods + generatorMethods + byKindGenerators + list(pieceGenerators.values()):
+        stats[name] = [0, 0.0, [0] * histogramBuckets]
+    for piece in pieceGenerators:
+        movesPerPiece[piece] = 0
+    startTime = time.perf_counter()
+    stopTime = None
+
+def enable(*gameStates):
+    global stopTime
+    if not _originals:
+        if startTime is None:
+            reset()
+        stopTime = None
+        for name in methods:
+            _originals[name] = getattr(ChessEngine.GameState, name)
+            setattr(ChessEngine.GameState, name, _timed(name, _originals[name]))
+        for name in generatorMethods:
+            _originals[name] = getattr(ChessEngine.GameState, name)
+            setattr(ChessEngine.GameState, name, _timedIterator(name, _originals[name]))
+        for name in byKindGenerators:
+            _originals[name] = getattr(ChessEngine.GameState, name)
+            setattr(ChessEngine.GameState, name, _timedByKind(name, _originals[name]))
+        for piece, name in pieceGenerators.items():
+            _originals[name] = getattr(ChessEngine.GameState, name)
+            setattr(ChessEngine.GameState, name, _timedGenerator(piece, name, _originals[name]))
+    for gs in gameStates:
+        gs.initSwitcher()
+        _gameStates.append(gs)
+
+def disable():
+    global stopTime
+    for name, function in _originals.items():
+        setattr(ChessEngine.GameState, name, function)
+    _originals.clear()
+    for gs in _gameStates:
+        gs.initSwitcher()
+    _gameStates.clear()
+    stopTime = time.perf_counter()
+
+def _record(name, seconds):
+    entry = stats[name]
+    entry[0] += 1
+    entry[1] += seconds
+    entry[2][min(int(seconds * 1e6).bit_length(), histogramBuckets - 1)] += 1
+
+def _timed(name, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        _record(name, time.perf_counter() - start)
+        return result
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+# only the time inside the generator counts, recorded when it is used up or dropped (a cutoff)
+def _timedIterator(name, function):
+    def wrapper(*args, **kwargs):
+        iterator = function(*args, **kwargs)
+        seconds = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    return
+                seconds += time.perf_counter() - start
+                yield item
+        finally:
+            if name in stats: # a generator dropped after reset() has nowhere to go
+                _record(name, seconds)
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+def _timedByKind(name, function):
+    def wrapper(self, captures, possibleMoves = None):
+        start = time.perf_counter()
+        possibleMoves = function(self, captures, possibleMoves)
+        _record(name, time.perf_counter() - start)
+        board = self.board
+        for code in possibleMoves:
+            movesPerPiece[board[(code & 63) >> 3][code & 7][1]] += 1
+        return possibleMoves
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+# also counts the moves the generator appended
+def _timedGenerator(piece, name, function):
+    def wrapper(self, sq, possibleMoves):
+        before = len(possibleMoves)
+        start = time.perf_counter()
+        function(self, sq, possibleMoves)
+        _record(name, time.perf_counter() - start)
+        movesPerPiece[piece] += len(possibleMoves) - before
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+
+'''
+Everything measured since reset(), nodes are moves made (makeMoveCode calls).
+Histograms map a bucket label such as "<4us" to a call count.
+'''
+def report():
+    if startTime is None:
+        reset()
+    seconds = (stopTime or time.perf_counter()) - startTime
+    nodes = stats["makeMoveCode"][0]
+    functions = {}
+    for name, (calls, total, histogram) in stats.items():
+        if not calls:
+            continue
+        labels = ["<%dus" % (1 << i) for i in range(histogramBuckets - 1)] + [">=%dus" % (1 << (histogramBuckets - 2))]
+        functions[name] = {"calls": calls, "seconds": total, "usPerCall": total * 1e6 / calls,
+            "histogram": {label: count for label, count in zip(labels, histogram) if count}}
+    return {"seconds": seconds, "nodes": nodes, "nodesPerSecond": nodes / seconds if seconds else 0.0,
+        "movesPerPiece": dict(movesPerPiece), "functions": functions}
+
+def save(path, data = None):
+    with open(path, "w") as f:
+        json.dump(data or report(), f, indent = 1)
+
+# short text lines of a report: nodes/sec, then the methods taking the most time
+def summary(data = None, top = 5):
+    data = data or report()
+    lines = ["%d nodes  %.0f nodes/s" % (data["nodes"], data["nodesPerSecond"])]
+    functions = sorted(data["functions"].items(), key = lambda item: item[1]["seconds"], reverse = True)
+    for name, entry in functions[:top]:
+        lines.append("%-24s %8d calls %7.3fs %6.1fus" % (name, entry["calls"], entry["seconds"], entry["usPerCall"]))
+    moves = data["movesPerPiece"]
+    if any(moves.values()):
+        lines.append("moves " + " ".join("%s:%d" % (piece, count) for piece, count in moves.items()))
+    return lines
@@ -0,0 +1,242 @@
+'''
+Search for the best move of a GameState.
+Negamax with alpha-beta pruning and iterative deepening, quiescence search on captures,
+transposition table and staged move generation: hash move, captures by MVV-LVA,
+killer moves, then quiet moves by history (GameState.getStagedMoveCodes).
+'''
+import time
+from array import array
+from collections import namedtuple
+
+from ChessEngine import Move, pieceOn, isCapture, mvvLva
+from Evaluation import Evaluator
+from TranspositionTable import TranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+
+mateScore = 100000
+mateBound = mateScore - 1000 # scores above this are mates
+infinity = mateScore + 1
+maxPly = 128
+checkEvery = 128 # nodes between clock checks, a few milliseconds at Python speeds
+tablebaseWin = mateBound // 2 # below the mate scores, so not adjusted in the TT
+
+# bestMove and pv hold ChessEngine.Move objects
+SearchResult = namedtuple("SearchResult", ["bestMove", "score", "pv", "nodes", "depth", "time"])
+
+
+class Searcher():
+    # tablebase, if given, is a Tablebase.Tablebase probed instead of searching positions it covers
+    def __init__(self, ttSizeMB = 16, tablebase = None):
+        self.tt = TranspositionTable(ttSizeMB)
+        self.tablebase = tablebase
+        self.evaluator = Evaluator()
+        self.stopped = False
+        # move buffers per ply reused by every search: root and quiescence moves,
+        # and the captures, quiets and move checks of the staged generator
+        self.moveBuffers = [array("H") for _ in range(maxPly + 1)]
+        self.stageBuffers = [(array("H"), array("H"), array("H")) for _ in range(maxPly + 1)]
+
+    '''
+    Iterative deepening until maxDepth, timeLimit (seconds) or nodeLimit is reached.
+    When the budget runs out mid-iteration the best move found so far is returned.
+    info, if given, is called with a SearchResult after every completed depth.
+    stopEvent (a threading or multiprocessing Event) ends the search like stop() once it is set.
+    '''
+    def search(self, gs, maxDepth = maxPly, timeLimit = None, nodeLimit = None, info = None, stopEvent = None):
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.stopEvent = stopEvent
+        self.nodes = 0
+        self.stopped = False
+        self.killers = [[None, None] for _ in range(maxPly)]
+        self.history = {}
+        self.pvTable = [[] for _ in range(maxPly + 1)]
+
+        if self.tablebase is not None:
+            move = self.tablebase.getBestMove(gs)
+            if move is not None:
+                score = tablebaseScore(self.tablebase.probeWDL(gs), 0)
+                return SearchResult(move, score, [move], 0, 0, self.elapsed())
+
+        rootMoves = gs.getValidMoveCodes()
+        if not rootMoves:
+            return SearchResult(None, -mateScore if gs.checkMate else 0, [], 0, 0, 0.0)
+        result = self.makeResult(gs, [rootMoves[0]], 0, 0)
+
+        for depth in range(1, maxDepth + 1):
+            score = self.negamax(gs, depth, -infinity, infinity, 0)
+            pv = self.pvTable[0]
+            if self.stopped:
+                # a partial iteration is only trusted once its first (previous best) move was searched
+                if pv and self.rootSearched:
+                    result = self.makeResult(gs, pv, self.rootScore, depth)
+                break
+            result = self.makeResult(gs, pv, score, depth)
+            if info is not None:
+                info(result)
+            if abs(score) > mateBound:
+                break
+        return result._replace(nodes = self.nodes, time = self.elapsed())
+
+    # turns the pv codes into Move objects by replaying them from the root
+    def makeResult(self, gs, pv, score, depth):
+        moves = []
+        for code in pv:
+            moves.append(Move.fromId(code, gs.board))
+            gs.makeMoveCode(code)
+        for _ in pv:
+            gs.undoMove()
+        return SearchResult(moves[0], score, moves, self.nodes, depth, self.elapsed())
+
+    # can be called from another thread to end the search early
+    def stop(self):
+        self.stopped = True
+
+    def elapsed(self):
+        return time.perf_counter() - self.startTime
+
+    def checkLimits(self):
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            self.stopped = True
+        elif self.nodes % checkEvery == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                self.stopped = True
+            elif self.stopEvent is not None and self.stopEvent.is_set():
+                self.stopped = True
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        self.pvTable[ply] = []
+        if depth <= 0 or ply >= maxPly:
+            return self.quiescence(gs, alpha, beta, ply)
+        self.nodes += 1
+        self.checkLimits()
+        if self.stopped:
+            return 0
+        # a repeated position can be repeated again, so it is scored as a draw right away
+        if ply > 0 and (gs.isRepetition(2) or gs.isFiftyMoveRule()):
+            return 0
+        if self.tablebase is not None and ply > 0:
+            wdl = self.tablebase.probeWDL(gs)
+            if wdl is not None:
+                return tablebaseScore(wdl, ply)
+
+        alphaOrig = alpha
+        key = gs.zobristKey
+        entry = self.tt.probe(key)
+        hashMove = 0
+        if entry is not None:
+            hashMove, ttScore, ttDepth, ttFlag = entry
+            if ply > 0 and ttDepth >= depth:
+                ttScore = scoreFromTT(ttScore, ply)
+                if ttFlag == EXACT:
+                    return ttScore
+                if ttFlag == LOWERBOUND and ttScore >= beta:
+                    return ttScore
+                if ttFlag == UPPERBOUND and ttScore <= alpha:
+                    return ttScore
+
+        if ply == 0:
+            self.rootSearched = False
+        bestScore = -infinity
+        bestMove = None
+        for move in self.orderMoves(gs, hashMove, ply):
+            gs.makeMoveCode(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                    if ply == 0:
+                        self.rootScore = score
+                    if alpha >= beta:
+                        if not isCapture(gs.board, move):
+                            self.storeKiller(move, ply)
+                            historyKey = historyKeyOf(gs.board, move)
+                            self.history[historyKey] = self.history.get(historyKey, 0) + depth * depth
+                        break
+            if ply == 0:
+                self.rootSearched = True
+        if bestMove is None:
+            # no legal move, the move generator has set checkMate or staleMate
+            return -mateScore + ply if gs.checkMate else 0
+
+        if bestScore <= alphaOrig:
+            flag = UPPERBOUND
+        elif bestScore >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, scoreToTT(bestScore, ply), flag, bestMove)
+        return bestScore
+
+    # only captures are searched, the side to move may also "stand pat" on the static score
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        self.checkLimits()
+        if self.stopped:
+            return 0
+        standPat = self.evaluator.evaluate(gs)
+        if standPat >= beta or ply >= maxPly:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+
+        board = gs.board
+        captures = sorted(gs.getCaptureMoveCodes(self.moveBuffers[ply]), key = lambda move: mvvLva(board, move), reverse = True)
+        for move in captures:
+            gs.makeMoveCode(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    # hash move, captures by MVV-LVA, killers, quiet moves by history; generated stage by stage
+    def orderMoves(self, gs, hashMove, ply):
+        board = gs.board
+        history = self.history
+        return gs.getStagedMoveCodes(hashMove, self.killers[ply],
+            lambda move: history.get(historyKeyOf(board, move), 0), self.stageBuffers[ply])
+
+    def storeKiller(self, move, ply):
+        killers = self.killers[ply]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+
+
+# moves are ChessEngine move codes, pieces are read from the board before the move is made
+def historyKeyOf(board, move):
+    return (pieceOn(board, move & 63), (move >> 6) & 63)
+
+# tablebase wins found closer to the root score higher
+def tablebaseScore(wdl, ply):
+    if wdl > 0:
+        return tablebaseWin - ply
+    if wdl < 0:
+        return -tablebaseWin + ply
+    return 0
+
+# mate scores are stored relative to the node so they stay valid at other plies
+def scoreToTT(score, ply):
+    if score > mateBound:
+        return score + ply
+    if score < -mateBound:
+        return score - ply
+    return score
+
+def scoreFromTT(score, ply):
+    if score > mateBound:
+        return score - ply
+    if score < -mateBound:
+        return score + ply
+    return score
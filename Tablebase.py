@@ -0,0 +1,457 @@
+'''
+Endgame tablebases: exact win/draw/loss (WDL) and distance to zeroing (DTZ) for positions
+with few pieces, read from a directory of table files.
+
+The layout follows Syzygy: one pair of files per material signature ("KQvK.tbw" for WDL,
+"KQvK.tbz" for DTZ), the stronger side first, positions with the colors swapped are found
+by flipping the board. The file format is this repo's own, not real Syzygy compression:
+a header, block offsets and zlib compressed blocks of fixed entry count. Files are opened
+and memory-mapped on first use, decompressed blocks are kept in a bounded LRU cache.
+
+WDL is 2 (win), 0 (draw) or -2 (loss) for the side to move. DTZ is the number of plies to
+the next capture, pawn move or mate, positive when winning and negative when losing.
+The fifty move rule is ignored and positions with castling rights or an en passant
+square are not probed. Tables are built by retrograde analysis with generate(), e.g.
+
+    python Tablebase.py --generate KQvK KRvK --directory tables
+'''
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import OrderedDict
+
+import Bitboard
+import ChessEngine
+
+wdlSuffix = ".tbw"
+dtzSuffix = ".tbz"
+magic = b"TBPY"
+_header = struct.Struct("<4sBBBBIII") # magic, version, kind, pieces, reserved, entries, block entries, blocks
+_offset = struct.Struct("<Q")
+pieceOrder = "KQRBNp" # order of the pieces in a signature
+WIN, DRAW, LOSS = 2, 0, -2
+
+
+'''
+Material signature of gs with white first, e.g. "KQvK".
+'''
+def signatureOf(gs):
+    sides = []
+    for color in "wb":
+        sides.append("".join(piece.upper() * Bitboard.popCount(gs.bitboards[color+piece]) for piece in pieceOrder))
+    return "v".join(sides)
+
+def flipSignature(signature):
+    white, black = signature.split("v")
+    return black + "v" + white
+
+# kings alone, or a single knight or bishop, can never mate
+def isTrivialDraw(signature):
+    return signature.replace("v", "") in ("KK", "KNK", "KKN", "KBK", "KKB")
+
+
+'''
+Maps positions of one signature to table indexes and back.
+The white king is moved into the a1-d1-d4 triangle (pawnless tables) or onto files a-d
+(tables with pawns) by mirroring the board, which shrinks the table 8 or 2 times.
+'''
+class TableLayout():
+    def __init__(self, signature):
+        self.signature = signature
+        white, black = signature.split("v")
+        self.pieces = [("w", piece if piece != "P" else "p") for piece in white] + \
+            [("b", piece if piece != "P" else "p") for piece in black]
+        self.hasPawns = "P" in signature
+        if self.hasPawns:
+            self.kingSquares = [sq for sq in range(64) if sq & 7 < 4]
+        else:
+            # rank index 7 - row is at most the file
+            self.kingSquares = [sq for sq in range(64) if sq & 7 < 4 and sq >> 3 >= 4 and 7 - (sq >> 3) <= (sq & 7)]
+        self.kingSlots = {sq: slot for slot, sq in enumerate(self.kingSquares)}
+        self.size = 2 * len(self.kingSquares) * 64 ** (len(self.pieces) - 1)
+
+    # the squares mirrored so the white king (first piece) lands on one of kingSquares
+    def canonical(self, squares):
+        kingSq = squares[0]
+        if kingSq & 7 > 3:
+            squares = [sq ^ 7 for sq in squares]
+            kingSq ^= 7
+        if self.hasPawns:
+            return squares
+        if kingSq >> 3 < 4:
+            squares = [sq ^ 56 for sq in squares]
+            kingSq ^= 56
+        if 7 - (kingSq >> 3) > (kingSq & 7):
+            # mirror on the a1-h8 diagonal
+            squares = [(7 - (sq & 7)) * 8 + 7 - (sq >> 3) for sq in squares]
+        return squares
+
+    def encode(self, squares, whiteToMove):
+        squares = self.canonical(squares)
+        index = 0
+        for sq in reversed(squares[1:]):
+            index = index * 64 + sq
+        index = index * len(self.kingSquares) + self.kingSlots[squares[0]]
+        return index * 2 + (0 if whiteToMove else 1)
+
+    def decode(self, index):
+        whiteToMove = index % 2 == 0
+        index //= 2
+        squares = [self.kingSquares[index % len(self.kingSquares)]]
+        index //= len(self.kingSquares)
+        for _ in self.pieces[1:]:
+            squares.append(index % 64)
+            index //= 64
+        return squares, whiteToMove
+
+    '''
+    Squares of gs's pieces in layout order. With flip the colors are swapped
+    and the board mirrored, for positions where black has the signature's white pieces.
+    '''
+    def squaresOf(self, gs, flip):
+        squares = []
+        seen = {}
+        for color, piece in self.pieces:
+            if flip:
+                color = "b" if color == "w" else "w"
+            own = list(Bitboard.squares(gs.bitboards[color+piece]))
+            count = seen.get(color+piece, 0)
+            seen[color+piece] = count + 1
+            squares.append(own[count] ^ 56 if flip else own[count])
+        return squares
+
+
+class TableFile():
+    '''
+    One table file, mapped on first use. Values are read through the owner's block cache.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        fileMagic, version, self.kind, self.pieces, reserved, self.entries, self.blockEntries, self.blocks = \
+            _header.unpack_from(self.data, 0)
+        if fileMagic != magic or version != 1:
+            raise ValueError("not a table file: " + self.path)
+        self.dataStart = _header.size + _offset.size * (self.blocks + 1)
+
+    def close(self):
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+            self.file = None
+
+    def readBlock(self, block):
+        start = _offset.unpack_from(self.data, _header.size + _offset.size * block)[0]
+        end = _offset.unpack_from(self.data, _header.size + _offset.size * (block + 1))[0]
+        values = array("b" if self.kind == 0 else "h")
+        values.frombytes(zlib.decompress(self.data[self.dataStart + start:self.dataStart + end]))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+
+class Tablebase():
+    '''
+    All tables of a directory. Only the directory listing is read up front,
+    cacheBlocks bounds the number of decompressed blocks kept in memory.
+    '''
+    def __init__(self, directory, cacheBlocks = 1024):
+        self.directory = directory
+        self.cacheBlocks = cacheBlocks
+        self.cache = OrderedDict() # (path, block) -> values, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.files = {}
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        self.signatures = {name[:-len(wdlSuffix)] for name in names if name.endswith(wdlSuffix)}
+        self.maxPieces = max((len(signature) - 1 for signature in self.signatures), default = 2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for tableFile in self.files.values():
+            tableFile.close()
+        self.files = {}
+        self.cache.clear()
+
+    def value(self, path, index):
+        tableFile = self.files.get(path)
+        if tableFile is None:
+            tableFile = self.files[path] = TableFile(path)
+        if tableFile.file is None:
+            tableFile.open()
+        block, offset = divmod(index, tableFile.blockEntries)
+        key = (path, block)
+        values = self.cache.get(key)
+        if values is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        else:
+            self.misses += 1
+            values = tableFile.readBlock(block)
+            self.cache[key] = values
+            if len(self.cache) > self.cacheBlocks:
+                self.cache.popitem(last = False)
+        return values[offset]
+
+    # (layout, index) of gs in its table, or None when it is not covered
+    def locate(self, gs):
+        if gs.castlingRights or gs.enpassantPossible or Bitboard.popCount(gs.occupied) > self.maxPieces:
+            return None
+        signature = signatureOf(gs)
+        flip = False
+        if signature not in self.signatures:
+            signature = flipSignature(signature)
+            flip = True
+            if signature not in self.signatures:
+                return None
+        layout = TableLayout(signature)
+        whiteToMove = gs.whiteToMove != flip
+        return layout, layout.encode(layout.squaresOf(gs, flip), whiteToMove)
+
+    def probe(self, gs, suffix):
+        # the search probes every node, the piece count rules out most of them cheaply
+        if Bitboard.popCount(gs.occupied) > max(self.maxPieces, 3):
+            return None
+        if isTrivialDraw(signatureOf(gs)) and not gs.castlingRights:
+            return 0
+        location = self.locate(gs)
+        if location is None:
+            return None
+        layout, index = location
+        return self.value(os.path.join(self.directory, layout.signature + suffix), index)
+
+    # WDL for the side to move, None if there is no table
+    def probeWDL(self, gs):
+        return self.probe(gs, wdlSuffix)
+
+    def probeDTZ(self, gs):
+        return self.probe(gs, dtzSuffix)
+
+    '''
+    The move that keeps the tablebase result: the fastest zeroing of a win,
+    any drawing move in a draw and the longest resistance in a loss. None if gs is not covered.
+    '''
+    def getBestMove(self, gs):
+        wdl = self.probeWDL(gs)
+        if wdl is None:
+            return None
+        best = None
+        bestRank = None
+        for move in gs.getValidMoves():
+            zeroing = move.pieceCaptured != "--" or move.pieceMoved[1] == "p"
+            gs.makeMove(move)
+            childWDL = self.probeWDL(gs)
+            childDTZ = self.probeDTZ(gs)
+            gs.undoMove()
+            if childWDL is None:
+                continue
+            distance = 0 if zeroing else abs(childDTZ)
+            if wdl == WIN:
+                rank = (childWDL == LOSS, -distance) # mates have distance 0
+            elif wdl == DRAW:
+                rank = (childWDL == DRAW, 0)
+            else:
+                rank = (childWDL != WIN, distance)
+            if bestRank is None or rank > bestRank:
+                best, bestRank = move, rank
+        return best
+
+
+'''
+Builds the WDL and DTZ files of signature (e.g. "KRvK") in directory.
+Captures and promotions are looked up in the smaller tables, which have to be generated first.
+'''
+def generate(signature, directory, blockEntries = 4096):
+    os.makedirs(directory, exist_ok = True)
+    layout = TableLayout(signature)
+    with Tablebase(directory) as tablebase:
+        positions, moves, outcomes, mated = _moveGraph(layout, tablebase)
+    # WDL: every move that stays in the table is followed
+    children = [None] * layout.size
+    for index in positions:
+        children[index] = [child for child, zeroing in moves[index]]
+    wdl, distance = _retrograde(layout.size, positions, children, outcomes, mated)
+    if layout.hasPawns:
+        # DTZ stops at pawn moves as well, they end the count with the WDL found above
+        counted = [None] * layout.size
+        zeroingOutcomes = [None] * layout.size
+        for index in positions:
+            counted[index] = [child for child, zeroing in moves[index] if not zeroing]
+            zeroingOutcomes[index] = outcomes[index] + [wdl[child] for child, zeroing in moves[index] if zeroing]
+        distance = _retrograde(layout.size, positions, counted, zeroingOutcomes, mated)[1]
+    dtz = array("h", (distance[i] if wdl[i] == WIN else -distance[i] if wdl[i] == LOSS else 0 for i in range(layout.size)))
+    _writeTable(os.path.join(directory, signature + wdlSuffix), 0, len(layout.pieces), wdl, blockEntries)
+    _writeTable(os.path.join(directory, signature + dtzSuffix), 1, len(layout.pieces), dtz, blockEntries)
+
+def _moveGraph(layout, tablebase):
+    '''
+    For every legal position: children (index, zeroing) for the moves that stay in the table
+    and outcomes, the WDL of the position after each capture or promotion (from the opponent's side).
+    mated holds the positions that are checkmate.
+    '''
+    gs = ChessEngine.GameState()
+    positions = []
+    mated = set()
+    children = [None] * layout.size
+    outcomes = [None] * layout.size
+    for index in range(layout.size):
+        squares, whiteToMove = layout.decode(index)
+        if not _setPosition(gs, layout, squares, whiteToMove):
+            continue
+        positions.append(index)
+        children[index] = []
+        outcomes[index] = []
+        slots = {sq: slot for slot, sq in enumerate(squares)}
+        for code in gs.getValidMoveCodes():
+            startSq, endSq = code & 63, (code >> 6) & 63
+            if endSq in slots or code & ChessEngine.flagMask == ChessEngine.promotionFlag:
+                gs.makeMoveCode(code)
+                outcome = tablebase.probeWDL(gs)
+                gs.undoMove()
+                if outcome is None:
+                    raise ValueError("generate the smaller tables first, %s is missing" % signatureOf(gs))
+                outcomes[index].append(outcome)
+            else:
+                childSquares = list(squares)
+                childSquares[slots[startSq]] = endSq
+                zeroing = layout.pieces[slots[startSq]][1] == "p"
+                children[index].append((layout.encode(childSquares, not whiteToMove), zeroing))
+        if gs.checkMate:
+            mated.add(index)
+    return positions, children, outcomes, mated
+
+# puts the pieces on an empty board, False if the position can't occur
+def _setPosition(gs, layout, squares, whiteToMove):
+    if len(set(squares)) != len(squares):
+        return False
+    gs.board = [["--"] * 8 for _ in range(8)]
+    for (color, piece), sq in zip(layout.pieces, squares):
+        if piece == "p" and sq >> 3 in (0, 7):
+            return False
+        gs.board[sq >> 3][sq & 7] = color + piece
+        if piece == "K":
+            if color == "w":
+                gs.whiteKingLocation = (sq >> 3, sq & 7)
+            else:
+                gs.blackKingLocation = (sq >> 3, sq & 7)
+    gs.whiteToMove = whiteToMove
+    gs.castlingRights = 0
+    gs.enpassantPossible = ()
+    gs.halfmoveClock = 0
+    gs.moveList = []
+    gs.initBitboards()
+    gs.resetHistory()
+    # the side that just moved can't be in check
+    color, enemy = ("w", "b") if whiteToMove else ("b", "w")
+    enemyKing = gs.bitboards[enemy+"K"].bit_length() - 1
+    return not gs.attackersTo(enemyKing, color, gs.occupied)
+
+def _retrograde(size, positions, children, outcomes, mated):
+    '''
+    Solves the positions backwards from the end of the count. Positions without moves are
+    mates (or stalemates), outcomes are moves that end the count with a known result.
+    Returns (wdl, distance) arrays, distance is in plies to the end of the count.
+    '''
+    wdl = array("b", bytes(size))
+    distance = array("H", bytes(2 * size))
+    solved = bytearray(size)
+    remaining = array("H", bytes(2 * size))
+    parents = [[] for _ in range(size)]
+    buckets = [[], []]
+    for index in positions:
+        for child in children[index]:
+            parents[child].append(index)
+    for index in positions:
+        results = outcomes[index]
+        if not children[index] and not results:
+            # no legal moves: stalemates are found as draws at the end
+            if index in mated:
+                wdl[index] = LOSS
+                solved[index] = 1
+                buckets[0].append(index)
+            continue
+        if LOSS in results:
+            wdl[index] = WIN
+        remaining[index] = len(children[index]) + sum(1 for result in results if result != WIN)
+        if wdl[index] != WIN and remaining[index] == 0:
+            wdl[index] = LOSS
+        if wdl[index]:
+            solved[index] = 1
+            distance[index] = 1
+            buckets[1].append(index)
+    depth = 0
+    while depth < len(buckets):
+        for index in buckets[depth]:
+            for parent in parents[index]:
+                if solved[parent]:
+                    continue
+                if wdl[index] == LOSS:
+                    wdl[parent] = WIN
+                else:
+                    remaining[parent] -= 1
+                    if remaining[parent]:
+                        continue
+                    wdl[parent] = LOSS
+                solved[parent] = 1
+                distance[parent] = depth + 1
+                if len(buckets) <= depth + 1:
+                    buckets.append([])
+                buckets[depth + 1].append(parent)
+        depth += 1
+    return wdl, distance
+
+def _writeTable(path, kind, pieces, values, blockEntries):
+    blocks = []
+    for start in range(0, len(values), blockEntries):
+        block = values[start:start + blockEntries]
+        if sys.byteorder == "big":
+            block.byteswap()
+        blocks.append(zlib.compress(block.tobytes(), 9))
+    offsets = [0]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    with open(path, "wb") as f:
+        f.write(_header.pack(magic, 1, kind, pieces, 0, len(values), blockEntries, len(blocks)))
+        for offset in offsets:
+            f.write(_offset.pack(offset))
+        for block in blocks:
+            f.write(block)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Endgame tablebase generation and probing")
+    parser.add_argument("--directory", default = "tables", help = "table directory (default tables)")
+    parser.add_argument("--generate", nargs = "+", metavar = "SIGNATURE", help = "build tables, e.g. KQvK KRvK")
+    parser.add_argument("--probe", metavar = "FEN", help = "print WDL, DTZ and the best move of a position")
+    args = parser.parse_args(argv)
+
+    for signature in args.generate or []:
+        generate(signature, args.directory)
+        print("generated " + signature)
+    if args.probe:
+        gs = ChessEngine.GameState.fromFEN(args.probe)
+        with Tablebase(args.directory) as tablebase:
+            wdl = tablebase.probeWDL(gs)
+            if wdl is None:
+                print("not in the tablebase")
+                return 1
+            move = tablebase.getBestMove(gs)
+            print("wdl %d  dtz %d  best %s" % (wdl, tablebase.probeDTZ(gs), move.getChessNotation() if move else "-"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
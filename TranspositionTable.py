@@ -0,0 +1,77 @@
+'''
+Fixed size transposition table keyed by Zobrist keys.
+Every bucket has two slots: a depth-preferred slot that is only replaced by a deeper
+(or equally deep) search of any position, and an always-replace slot that takes everything else.
+Entries are packed into two unsigned 64-bit arrays so the memory use follows the budget.
+'''
+from array import array
+
+EXACT, LOWERBOUND, UPPERBOUND = 0, 1, 2
+
+entryBytes = 16 # one key and one data word
+scoreOffset = 1 << 31
+
+# data word layout: score (32 bits) | depth (8) | flag (2) | move (20)
+_moveBits, _flagBits, _depthBits = 20, 2, 8
+_moveMask = (1 << _moveBits) - 1
+_flagShift = _moveBits
+_depthShift = _flagShift + _flagBits
+_scoreShift = _depthShift + _depthBits
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB = 16):
+        self.resize(sizeMB)
+
+    def resize(self, sizeMB):
+        self.sizeMB = sizeMB
+        self.buckets = max(1, sizeMB * 1024 * 1024 // (2 * entryBytes))
+        self.clear()
+
+    def clear(self):
+        self.keys = array("Q", bytes(16 * self.buckets))
+        self.data = array("Q", bytes(16 * self.buckets))
+        self.hits = 0
+        self.misses = 0
+
+    '''
+    Returns (move, score, depth, flag) or None.
+    move is whatever int the caller stored, 0 when there was none.
+    '''
+    def probe(self, key):
+        index = 2 * (key % self.buckets)
+        for slot in (index, index + 1):
+            if self.keys[slot] == key and self.data[slot]:
+                self.hits += 1
+                return self.unpack(self.data[slot])
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, flag, move = 0):
+        index = 2 * (key % self.buckets)
+        data = self.pack(depth, score, flag, move)
+        # depth-preferred slot: same position or at least as deep a search
+        if self.keys[index] == key or not self.data[index] or depth >= self.unpack(self.data[index])[2]:
+            self.keys[index] = key
+            self.data[index] = data
+        else:
+            self.keys[index + 1] = key
+            self.data[index + 1] = data
+
+    # fraction of slots in use, in permille like the UCI hashfull
+    def hashFull(self):
+        sample = min(len(self.data), 1000)
+        return sum(1 for i in range(sample) if self.data[i]) * 1000 // sample
+
+    @staticmethod
+    def pack(depth, score, flag, move):
+        # depth is stored +1 so a used slot never packs to 0
+        return ((score + scoreOffset) << _scoreShift) | ((depth + 1) << _depthShift) | (flag << _flagShift) | (move & _moveMask)
+
+    @staticmethod
+    def unpack(data):
+        move = data & _moveMask
+        flag = (data >> _flagShift) & ((1 << _flagBits) - 1)
+        depth = ((data >> _depthShift) & ((1 << _depthBits) - 1)) - 1
+        score = (data >> _scoreShift) - scoreOffset
+        return move, score, depth, flag
@@ -0,0 +1,260 @@
+'''
+Headless UCI (Universal Chess Interface) engine, for tournament managers and the match runner:
+
+    python UCI.py
+
+Commands are read with an asyncio loop while the search runs in a thread,
+so stop and isready are answered while the engine is thinking.
+Only the engine modules are imported (no pygame) to keep the start up fast.
+'''
+import asyncio
+import os
+import sys
+import threading
+
+import ChessEngine
+import Search
+
+engineName = "Chess"
+engineAuthor = "hytonenj"
+defaultMovesToGo = 30 # assumed moves left in sudden death time controls
+moveOverhead = 0.05 # seconds kept back per move for communication
+hashRange = (1, 1024) # MB
+
+
+# long algebraic notation used by UCI: e2e4, e7e8q, e1g1 for castling
+def uciMove(move):
+    return move.getChessNotation() + (move.promotionPiece.lower() if move.isPawnPromotion else "")
+
+def moveFromUCI(gs, text):
+    for move in gs.getValidMoves():
+        if uciMove(move) == text:
+            return move
+    raise ValueError("illegal move: " + text)
+
+def scoreText(score):
+    if abs(score) > Search.mateBound:
+        plies = Search.mateScore - abs(score)
+        return "mate %d" % ((plies + 1) // 2 if score > 0 else -((plies + 1) // 2))
+    return "cp %d" % score
+
+'''
+Seconds to spend on this move from the go parameters (milliseconds as in UCI), None for no limit.
+'''
+def timeForMove(params, whiteToMove):
+    if "movetime" in params:
+        return max(params["movetime"] / 1000 - moveOverhead, 0.01)
+    remaining = params.get("wtime" if whiteToMove else "btime")
+    if remaining is None:
+        return None
+    increment = params.get("winc" if whiteToMove else "binc", 0)
+    movesToGo = params.get("movestogo", defaultMovesToGo)
+    budget = remaining / movesToGo + increment * 0.8
+    return max(min(budget, remaining / 2) / 1000 - moveOverhead, 0.01)
+
+
+class UCIEngine():
+    def __init__(self, output = None):
+        self.output = output or sys.stdout
+        self.outputLock = threading.Lock()
+        self.hashMB = 16
+        self.searcher = Search.Searcher(self.hashMB)
+        self.book = None
+        self.tablebase = None
+        self.gs = ChessEngine.GameState() # None after a position command that failed
+        self.stopEvent = threading.Event()
+        self.searchTask = None
+
+    # can be called from the search thread
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    async def run(self, input = None):
+        input = input or sys.stdin
+        while True:
+            line = await asyncio.to_thread(input.readline)
+            if not line: # end of input
+                line = "quit"
+            if not await self.handle(line.strip()):
+                break
+
+    # returns False on quit, a failing command is reported and the engine goes on
+    async def handle(self, line):
+        try:
+            return await self.handleCommand(line)
+        except Exception as error:
+            self.send("info string error in %r: %r" % (line, error))
+            return True
+
+    async def handleCommand(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + engineName)
+            self.send("id author " + engineAuthor)
+            self.send("option name Hash type spin default 16 min %d max %d" % hashRange)
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            await self.stopSearch()
+            self.setOption(args)
+        elif command == "ucinewgame":
+            await self.stopSearch()
+            self.searcher.tt.clear()
+            self.gs = ChessEngine.GameState()
+        elif command == "position":
+            await self.stopSearch()
+            try:
+                self.gs = self.parsePosition(args)
+            except (ValueError, IndexError, KeyError) as error:
+                # searching the previous position instead would go unnoticed
+                self.gs = None
+                self.send("info string invalid position, go is refused until the next position: %s" % error)
+        elif command == "go":
+            await self.stopSearch()
+            self.stopEvent.clear()
+            self.searchTask = asyncio.create_task(asyncio.to_thread(self.go, args))
+        elif command == "stop":
+            await self.stopSearch()
+        elif command == "quit":
+            await self.stopSearch()
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    async def stopSearch(self):
+        if self.searchTask is not None:
+            self.stopEvent.set()
+            task, self.searchTask = self.searchTask, None
+            try:
+                await task
+            except Exception as error:
+                self.send("info string search failed: %r" % error)
+
+    def setOption(self, args):
+        text = " ".join(args)
+        if not text.startswith("name ") or " value " not in text:
+            return
+        name, value = text[5:].split(" value ", 1)
+        value = value.strip()
+        empty = value in ("", "<empty>")
+        if name == "Hash":
+            if not value.isdigit() or not hashRange[0] <= int(value) <= hashRange[1]:
+                self.send("info string Hash must be a number from %d to %d, keeping %d" % (hashRange + (self.hashMB,)))
+                return
+            self.hashMB = int(value)
+            self.searcher.tt.resize(self.hashMB)
+        elif name == "BookFile":
+            import OpeningBook
+            if not empty and not os.path.isfile(value):
+                self.send("info string book file not found: " + value)
+                return
+            if self.book is not None:
+                self.book.close()
+            self.book = None if empty else OpeningBook.OpeningBook(value)
+        elif name == "TablebasePath":
+            import Tablebase
+            if not empty and not os.path.isdir(value):
+                self.send("info string tablebase directory not found: " + value)
+                return
+            self.tablebase = None if empty else Tablebase.Tablebase(value)
+            if self.tablebase is not None and not self.tablebase.signatures:
+                self.send("info string no tables in " + value)
+            self.searcher.tablebase = self.tablebase
+        else:
+            self.send("info string unknown option " + name)
+
+    # position startpos | fen <6 fields> [moves ...]
+    def parsePosition(self, args):
+        if args[0] == "startpos":
+            gs = ChessEngine.GameState()
+            rest = args[1:]
+        elif args[0] == "fen":
+            end = args.index("moves") if "moves" in args else len(args)
+            gs = ChessEngine.GameState.fromFEN(" ".join(args[1:end]))
+            rest = args[end:]
+        else:
+            raise ValueError("position needs startpos or fen")
+        if rest and rest[0] == "moves":
+            for text in rest[1:]:
+                gs.makeMove(moveFromUCI(gs, text))
+        return gs
+
+    def parseGo(self, args):
+        params = {}
+        i = 0
+        while i < len(args):
+            if args[i] in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes", "mate"):
+                if i + 1 == len(args) or not args[i + 1].lstrip("-").isdigit():
+                    raise ValueError("go %s needs a number" % args[i])
+                params[args[i]] = int(args[i + 1])
+                i += 2
+            else:
+                params[args[i]] = True # infinite, ponder
+                i += 1
+        return params
+
+    '''
+    Runs in a thread: searches a copy of the position and prints info lines and bestmove.
+    bestmove is always sent: after an error, malformed go arguments included, it is the
+    first legal move, 0000 without one.
+    '''
+    def go(self, args):
+        move = None
+        try:
+            if self.gs is None:
+                self.send("info string no valid position")
+                return
+            gs = ChessEngine.GameState.fromFEN(self.gs.startFEN)
+            for code in self.gs.moveList:
+                gs.makeMoveCode(code)
+            legal = gs.getValidMoves()
+            move = legal[0] if legal else None
+            params = self.parseGo(args)
+            infinite = params.get("infinite", False)
+            bookMove = self.bookMove(gs) if self.book is not None and not infinite else None
+            if bookMove is not None:
+                move = bookMove
+                return
+            result = self.searcher.search(gs, maxDepth = params.get("depth", Search.maxPly),
+                timeLimit = None if infinite else timeForMove(params, gs.whiteToMove),
+                nodeLimit = params.get("nodes"), info = self.sendInfo, stopEvent = self.stopEvent)
+            if result.bestMove is not None:
+                move = result.bestMove
+            if infinite:
+                # bestmove may only follow the stop command
+                self.stopEvent.wait()
+        except Exception as error:
+            self.send("info string search failed: %r" % error)
+        finally:
+            self.send("bestmove " + (uciMove(move) if move is not None else "0000"))
+
+    # None when the book has no move or cannot be read, the search takes over then
+    def bookMove(self, gs):
+        try:
+            return self.book.getMove(gs)
+        except (OSError, ValueError) as error:
+            self.send("info string book disabled: %r" % error)
+            self.book = None
+            return None
+
+    def sendInfo(self, result):
+        nps = int(result.nodes / result.time) if result.time else 0
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (result.depth, scoreText(result.score),
+            result.nodes, nps, int(result.time * 1000), " ".join(uciMove(move) for move in result.pv)))
+
+
+def main():
+    asyncio.run(UCIEngine().run())
+
+
+if __name__ == "__main__":
+    main()
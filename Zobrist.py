@@ -0,0 +1,35 @@
+'''
+Zobrist keys for hashing positions.
+The key of a position is the XOR of one random 64-bit number per (piece, square),
+one for black to move, one for the en passant square and one for the castling rights.
+'''
+import random
+
+_random = random.Random(20210131) # fixed seed so keys are the same in every process
+
+pieces = [color+piece for color in "wb" for piece in "pRNBQK"]
+pieceKeys = {piece: [_random.getrandbits(64) for _ in range(64)] for piece in pieces}
+blackToMoveKey = _random.getrandbits(64)
+enpassantKeys = [_random.getrandbits(64) for _ in range(64)]
+# indexed by a 4 bit castling rights value
+castlingKeys = [_random.getrandbits(64) for _ in range(16)]
+
+
+def enpassantKey(enpassantPossible):
+    if not enpassantPossible:
+        return 0
+    return enpassantKeys[enpassantPossible[0]*8 + enpassantPossible[1]]
+
+def computeKey(gs):
+    # from scratch, GameState keeps its key up to date incrementally
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != "--":
+                key ^= pieceKeys[piece][row*8 + col]
+    if not gs.whiteToMove:
+        key ^= blackToMoveKey
+    key ^= enpassantKey(gs.enpassantPossible)
+    key ^= castlingKeys[gs.castlingRights]
+    return key
@@ -0,0 +1,38 @@
+import time
+
+import Analysis
+import ChessEngine
+import pytest
+
+kiwipete = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+@pytest.fixture(scope = "module")
+def pool():
+    with Analysis.AnalysisPool(processes = 2, ttSizeMB = 1) as pool:
+        yield pool
+
+def testPerftSplitOverRootMoves(pool):
+    leaves, counts = pool.perft(ChessEngine.GameState.fromFEN(kiwipete), 2)
+    assert leaves == 2039 and len(counts) == 48
+
+def testPoolUsableAfterTimeout(pool):
+    results = list(pool.run([Analysis.Job("perft", kiwipete, depth = 6)], timeout = 0.3))
+    assert [result.status for result in results] == ["cancelled"]
+    result = pool.submit(Analysis.Job("perft", ChessEngine.startFEN, depth = 2)).result(timeout = 60)
+    assert (result.status, result.value) == ("ok", 400)
+
+def testCancelOneJob(pool):
+    long = pool.submit(Analysis.Job("perft", kiwipete, depth = 6))
+    short = pool.submit(Analysis.Job("perft", ChessEngine.startFEN, depth = 3))
+    time.sleep(0.2)
+    pool.cancel(long.jobId)
+    assert long.result(timeout = 60).status == "cancelled" or long.cancelled()
+    assert (short.result(timeout = 60).status, short.result().value) == ("ok", 8902)
+
+def testCancelSearch(pool):
+    future = pool.submit(Analysis.Job("search", ChessEngine.startFEN, depth = 30))
+    time.sleep(0.5)
+    pool.cancel(future.jobId)
+    result = future.result(timeout = 60)
+    assert result.status == "cancelled" and result.value[0] is not None
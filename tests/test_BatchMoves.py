@@ -0,0 +1,32 @@
+import os
+
+import ChessEngine
+import Perft
+import pytest
+
+pytest.importorskip("numpy")
+import BatchMoves
+
+corpusPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "legalMoves.txt")
+
+with open(corpusPath) as corpus:
+    fens = [line.split(";")[0] for line in corpus if line.strip() and not line.startswith("#")]
+# the corpus has no castling rights, the perft positions bring them back
+fens += [fen for name, fen, counts in Perft.referencePositions]
+
+
+@pytest.fixture(scope = "module")
+def generated():
+    batch = BatchMoves.encode([ChessEngine.GameState.fromFEN(fen) for fen in fens])
+    return batch, BatchMoves.generate(batch)
+
+@pytest.mark.parametrize("index", range(len(fens)))
+def testBatchAgreesWithGameState(generated, index):
+    batch, moves = generated
+    assert BatchMoves.crossCheck(batch, moves, index) == []
+
+# a batch holds no move clocks
+def testRoundTrip(generated):
+    batch, moves = generated
+    for index, fen in enumerate(fens):
+        assert BatchMoves.gameState(batch, index).toFEN().split()[:4] == ChessEngine.GameState.fromFEN(fen).toFEN().split()[:4]
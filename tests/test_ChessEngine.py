@@ -0,0 +1,120 @@
+import os
+import random
+
+import ChessEngine
+import Perft
+import pytest
+
+corpusPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "legalMoves.txt")
+perftLeafLimit = 10000 # the deeper counts are left to Perft.py
+
+
+def readCorpus():
+    with open(corpusPath) as corpus:
+        return [line.strip().split(";") for line in corpus if line.strip() and not line.startswith("#")]
+
+@pytest.mark.parametrize("fen, expected", readCorpus())
+def testLegalMovesMatchCorpus(fen, expected):
+    gs = ChessEngine.GameState.fromFEN(fen)
+    moves = {ChessEngine.Move.fromId(code, gs.board).getChessNotation() for code in gs.getValidMoveCodes()}
+    assert sorted(moves) == expected.split()
+    assert {move.getChessNotation() for move in gs.getValidMoves()} == moves
+
+@pytest.mark.parametrize("name, fen, depth, leaves", [(name, fen, depth, leaves)
+    for name, fen, counts in Perft.referencePositions for depth, leaves in counts.items() if leaves <= perftLeafLimit])
+def testPerftReferenceCounts(name, fen, depth, leaves):
+    assert Perft.perft(ChessEngine.GameState.fromFEN(fen), depth) == leaves
+
+
+corpusFENs = [fen for fen, expected in readCorpus()]
+
+@pytest.mark.parametrize("fen", corpusFENs)
+def testStagedMovesArePermutationOfValid(fen):
+    gs = ChessEngine.GameState.fromFEN(fen)
+    valid = list(gs.getValidMoveCodes())
+    staged = list(gs.getStagedMoveCodes())
+    assert sorted(staged) == sorted(valid) and len(set(staged)) == len(staged)
+    captures = list(gs.getCaptureMoveCodes())
+    quiets = list(gs.getQuietMoveCodes())
+    assert sorted(captures + quiets) == sorted(valid)
+    assert all(ChessEngine.isCapture(gs.board, move) for move in captures)
+    assert not any(ChessEngine.isCapture(gs.board, move) for move in quiets)
+    # captures first, most valuable victim / least valuable attacker first
+    assert sorted(staged[:len(captures)]) == sorted(captures)
+    scores = [ChessEngine.mvvLva(gs.board, move) for move in staged[:len(captures)]]
+    assert scores == sorted(scores, reverse = True)
+
+@pytest.mark.parametrize("index", range(0, len(corpusFENs), 3))
+def testStagedMovesWithHashAndKillers(index):
+    rng = random.Random(index)
+    gs = ChessEngine.GameState.fromFEN(corpusFENs[index])
+    valid = set(gs.getValidMoveCodes())
+    # moves of other positions, random codes and, where there are some, legal moves of this one
+    foreign = list(ChessEngine.GameState.fromFEN(corpusFENs[index - 1]).getValidMoveCodes())
+    candidates = foreign + [rng.randrange(1, 1 << 16) for i in range(20)] + list(valid)
+    for attempt in range(10):
+        hashMove = rng.choice(candidates)
+        killers = tuple(rng.choice(candidates) for i in range(2))
+        staged = list(gs.getStagedMoveCodes(hashMove, killers))
+        assert sorted(staged) == sorted(valid) and len(set(staged)) == len(staged)
+        if hashMove in valid:
+            assert staged[0] == hashMove
+        # a legal quiet killer comes right after the captures
+        captureCount = len(gs.getCaptureMoveCodes()) + (hashMove in valid and not ChessEngine.isCapture(gs.board, hashMove))
+        killer = killers[0]
+        if killer in valid and killer != hashMove and not ChessEngine.isCapture(gs.board, killer):
+            assert staged[captureCount] == killer
+
+
+def play(gs, *notations):
+    for notation in notations:
+        move, = [move for move in gs.getValidMoves() if move.getChessNotation() == notation]
+        gs.makeMove(move)
+
+def snapshot(gs):
+    return (gs.zobristKey, dict(gs.repetitions), gs.castlingRights, gs.enpassantPossible, gs.halfmoveClock,
+        gs.fullmoveNumber, gs.whiteToMove, [row[:] for row in gs.board], dict(gs.bitboards), gs.toFEN())
+
+def testThreefoldRepetition():
+    gs = ChessEngine.GameState()
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+    play(gs, *shuffle)
+    assert gs.isRepetition(2) and not gs.isRepetition() and not gs.isDraw()
+    play(gs, *shuffle)
+    assert gs.isRepetition() and gs.isDraw()
+    gs.undoMove()
+    assert gs.isRepetition(2) and not gs.isRepetition() # the position before the last knight move occurred twice
+
+def testFiftyMoveRule():
+    gs = ChessEngine.GameState.fromFEN("4k3/8/8/8/8/8/8/R3K3 w - - 99 80")
+    assert not gs.isFiftyMoveRule()
+    play(gs, "a1a2")
+    assert gs.halfmoveClock == 100 and gs.isFiftyMoveRule() and gs.isDraw()
+    gs.undoMove()
+    assert gs.halfmoveClock == 99 and not gs.isDraw()
+    play(gs, "a1a8") # a capture would reset the clock, check does not
+    assert gs.isFiftyMoveRule()
+    gs = ChessEngine.GameState.fromFEN("4k3/8/8/8/8/8/P7/4K3 w - - 99 80")
+    play(gs, "a2a3") # a pawn move resets it
+    assert gs.halfmoveClock == 0
+
+def testUndoAtStartPosition():
+    gs = ChessEngine.GameState()
+    before = snapshot(gs)
+    gs.undoMove()
+    assert snapshot(gs) == before
+
+@pytest.mark.parametrize("fen", [fen for name, fen, counts in Perft.referencePositions])
+def testMakeUndoRoundTrip(fen):
+    rng = random.Random(fen)
+    gs = ChessEngine.GameState.fromFEN(fen)
+    history = []
+    for ply in range(40):
+        moves = gs.getValidMoves()
+        if not moves:
+            break
+        history.append(snapshot(gs))
+        gs.makeMove(rng.choice(moves))
+    while history:
+        gs.undoMove()
+        assert snapshot(gs) == history.pop()
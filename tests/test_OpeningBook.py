@@ -0,0 +1,93 @@
+import random
+import struct
+
+import ChessEngine
+import OpeningBook
+import pytest
+
+castlingFEN = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+
+
+def play(gs, notations):
+    for notation in notations:
+        move, = [move for move in gs.getValidMoves() if move.getChessNotation() == notation]
+        gs.makeMove(move)
+    return gs
+
+def keyOf(fen = None, notations = ()):
+    return OpeningBook.polyglotKey(play(ChessEngine.GameState.fromFEN(fen or ChessEngine.startFEN), notations))
+
+# from-to text such as "e2e4" as a Polyglot move, rank 1 is row 0 there
+def polyglotMove(notation, promotion = 0):
+    files, ranks = [ord(notation[i]) - ord("a") for i in (0, 2)], [int(notation[i]) - 1 for i in (1, 3)]
+    return files[1] | ranks[1] << 3 | files[0] << 6 | ranks[0] << 9 | promotion << 12
+
+def writeBook(path, entries):
+    with open(path, "wb") as f:
+        for key, move, weight in sorted(entries, key = lambda entry: entry[0]):
+            f.write(struct.pack(">QHHI", key, move, weight, 0))
+    return str(path)
+
+
+# the reference keys of the Polyglot format description
+@pytest.mark.parametrize("notations, key", [
+    ((), 0x463B96181691FC9C),
+    (("e2e4",), 0x823C9B50FD114196),
+    (("e2e4", "d7d5"), 0x0756B94461C50FB0),
+    (("e2e4", "d7d5", "e4e5"), 0x662FAFB965DB29D4),
+    (("e2e4", "d7d5", "e4e5", "f7f5"), 0x22A48B5A8E47FF78),
+    (("e2e4", "d7d5", "e4e5", "f7f5", "e1e2"), 0x652A607CA3F242C1),
+    (("e2e4", "d7d5", "e4e5", "f7f5", "e1e2", "e8f7"), 0x00FDD303C946BDD9),
+    (("a2a4", "b7b5", "h2h4", "b5b4", "c2c4"), 0x3C8123EA7B067637),
+    (("a2a4", "b7b5", "h2h4", "b5b4", "c2c4", "b4c3", "a1a3"), 0x5C3F9B829B279560),
+])
+def testPolyglotKey(notations, key):
+    assert keyOf(notations = notations) == key
+
+def testFindBounds(tmp_path):
+    start = keyOf()
+    path = writeBook(tmp_path / "book.bin", [(1, 1, 1), (start, polyglotMove("e2e4"), 5), (start, polyglotMove("d2d4"), 3),
+        (start + 1, 7, 1), (2**64 - 1, 9, 1)])
+    with OpeningBook.OpeningBook(path) as book:
+        assert book.find(1) == [(1, 1)] # first entry
+        assert book.find(2**64 - 1) == [(9, 1)] # last entry
+        assert book.find(start) == [(polyglotMove("e2e4"), 5), (polyglotMove("d2d4"), 3)]
+        assert book.find(0) == [] and book.find(2) == [] and book.find(2**64 - 2) == []
+
+def testMoveSelection(tmp_path):
+    start = keyOf()
+    path = writeBook(tmp_path / "book.bin", [(start, polyglotMove("e2e4"), 3), (start, polyglotMove("d2d4"), 1),
+        (start, polyglotMove("g1f3"), 0), (start, polyglotMove("e2e5"), 100)]) # e2e5 is not legal
+    gs = ChessEngine.GameState()
+    with OpeningBook.OpeningBook(path) as book:
+        assert [(move.getChessNotation(), weight) for move, weight in book.getMoves(gs)] == \
+            [("e2e4", 3), ("d2d4", 1), ("g1f3", 0)]
+        assert book.getMove(gs, best = True).getChessNotation() == "e2e4"
+        rng = random.Random(1)
+        picks = [book.getMove(gs, rng = rng).getChessNotation() for i in range(400)]
+        assert "g1f3" not in picks and picks.count("e2e4") > 2 * picks.count("d2d4") > 0
+
+@pytest.mark.parametrize("fen, rookMove, kingMove", [
+    (castlingFEN, "e1h1", "e1g1"),
+    (castlingFEN, "e1a1", "e1c1"),
+    (castlingFEN.replace(" w ", " b "), "e8h8", "e8g8"),
+    (castlingFEN.replace(" w ", " b "), "e8a8", "e8c8"),
+])
+def testCastlingMoves(tmp_path, fen, rookMove, kingMove):
+    path = writeBook(tmp_path / "book.bin", [(keyOf(fen), polyglotMove(rookMove), 1)])
+    with OpeningBook.OpeningBook(path) as book:
+        assert book.getMove(ChessEngine.GameState.fromFEN(fen)).getChessNotation() == kingMove
+
+def testPromotionMove(tmp_path):
+    fen = "7k/P7/8/8/8/8/8/K7 w - - 0 1"
+    path = writeBook(tmp_path / "book.bin", [(keyOf(fen), polyglotMove("a7a8", promotion = 1), 1)])
+    with OpeningBook.OpeningBook(path) as book:
+        move = book.getMove(ChessEngine.GameState.fromFEN(fen))
+        assert move.getChessNotation() == "a7a8" and move.promotionPiece == "N"
+
+def testEmptyBook(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    with OpeningBook.OpeningBook(str(path)) as book:
+        assert book.find(keyOf()) == []
+        assert book.getMove(ChessEngine.GameState()) is None
@@ -0,0 +1,90 @@
+import ChessEngine
+import PGN
+import pytest
+
+twoGames = """[Event "first"]
+[White "A \\"quoted\\" name"]
+[Result "1-0"]
+
+1. e4 {a comment} e5 2. Nf3 (2. f4 exf4) Nc6 $1 3. Bb5 ; to the end of the line
+a6 1-0
+
+[Event "second"]
+
+1. d4 d5 1/2-1/2
+"""
+
+
+def testTokenizeKeepsOnlyMainLineMoves():
+    text = "1. e4 {c (not a variation)} e5 2. Nf3 (2. f4 (2. d4) exf4) Nc6 $14 3... Bb5 ; rest\n a6 *"
+    assert list(PGN.tokenize(text)) == ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "*"]
+
+def testTokenizeUnterminatedComment():
+    assert list(PGN.tokenize("1. e4 {never closed e5")) == ["e4"]
+
+def testReadGames():
+    games = list(PGN.readGames(twoGames.splitlines()))
+    assert len(games) == 2
+    assert games[0].headers["White"] == 'A "quoted" name'
+    assert games[0].moves == ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6"]
+    assert games[0].result == "1-0"
+    assert games[1].headers == {"Event": "second"}
+    assert games[1].moves == ["d4", "d5"]
+    assert games[1].result == "1/2-1/2"
+
+def testReadGamesWithoutTags():
+    games = list(PGN.readGames(["1. e4 e5 *"]))
+    assert len(games) == 1 and games[0].moves == ["e4", "e5"] and games[0].headers == {}
+
+def testReadGamesFENStart():
+    game = next(PGN.readGames(['[FEN "k7/8/8/8/8/8/8/K7 w - - 0 1"]', "", "1. Kb2 *"]))
+    assert game.startPosition().toFEN() == "k7/8/8/8/8/8/8/K7 w - - 0 1"
+    assert [move.getChessNotation() for move, gs in PGN.replay(game)] == ["a1b2"]
+
+@pytest.mark.parametrize("fen, san, notation, promotion", [
+    (ChessEngine.startFEN, "Nf3", "g1f3", None),
+    (ChessEngine.startFEN, "e4", "e2e4", None),
+    ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "O-O", "e1g1", None),
+    ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "0-0-0", "e8c8", None),
+    ("4k3/8/8/8/8/8/4K3/R6R w - - 0 1", "Rhf1", "h1f1", None), # file disambiguation
+    ("R3k3/8/8/8/8/8/8/R3K3 w - - 0 1", "R1a7", "a1a7", None), # rank disambiguation
+    ("7k/P7/8/8/8/8/8/K7 w - - 0 1", "a8=N+", "a7a8", "N"),
+    ("7k/P7/8/8/8/8/8/K7 w - - 0 1", "a8Q", "a7a8", "Q"),
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "exd6", "e5d6", None), # en passant
+])
+def testMoveFromSAN(fen, san, notation, promotion):
+    move = ChessEngine.GameState.fromFEN(fen).moveFromSAN(san)
+    assert move.getChessNotation() == notation
+    assert move.promotionPiece == promotion
+
+@pytest.mark.parametrize("fen, san", [
+    (ChessEngine.startFEN, "e5"), # illegal
+    (ChessEngine.startFEN, "O-O"), # illegal castling
+    ("4k3/8/8/8/8/8/4K3/R6R w - - 0 1", "Rf1"), # ambiguous
+    (ChessEngine.startFEN, "Zz9"), # unreadable
+])
+def testMoveFromSANRejects(fen, san):
+    with pytest.raises(ValueError):
+        ChessEngine.GameState.fromFEN(fen).moveFromSAN(san)
+
+def testSANRoundTrip():
+    gs = ChessEngine.GameState()
+    for move in gs.getValidMoves():
+        assert gs.moveFromSAN(gs.getSAN(move)) == move
+
+
+def moveCount(game):
+    return len(game.moves)
+
+@pytest.mark.parametrize("processes", [1, 2])
+def testReplayFileKeepsAHeaderlessFirstGame(tmp_path, processes):
+    path = tmp_path / "games.pgn"
+    path.write_text("1. e4 e5 *\n\n" + twoGames)
+    assert list(PGN.gameOffsets(str(path)))[0] == 0
+    assert list(PGN.replayFile(str(path), moveCount, processes = processes, gamesPerChunk = 1)) == [2, 6, 2]
+
+def testReplayFileManyChunksInOrder(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text("".join('[Event "%d"]\n\n%s *\n\n' % (i, " ".join(["1. e4", "e5", "2. Nf3", "Nc6"][:i % 4 + 1]))
+        for i in range(40)))
+    assert list(PGN.replayFile(str(path), moveCount, processes = 2, gamesPerChunk = 3)) == [i % 4 + 1 for i in range(40)]
@@ -0,0 +1,33 @@
+import ChessEngine
+import Perft
+import Profiler
+import pytest
+
+
+@pytest.fixture
+def profiled():
+    Profiler.reset()
+    yield Profiler
+    Profiler.disable()
+
+def testQueenMovesCountedOnce(profiled):
+    gs = ChessEngine.GameState.fromFEN("4k3/8/8/8/3Q4/8/8/4K3 w - - 0 1")
+    profiled.enable(gs)
+    assert len(gs.getAllPossibleMoveCodes()) == 32
+    assert profiled.movesPerPiece == {"p": 0, "R": 0, "N": 0, "B": 0, "K": 5, "Q": 27}
+    assert profiled.stats["getRookMoves"][0] == profiled.stats["getBishopMoves"][0] == 0
+
+@pytest.mark.parametrize("fen", [fen for name, fen, counts in Perft.referencePositions])
+def testMovesPerPieceAddUp(profiled, fen):
+    gs = ChessEngine.GameState.fromFEN(fen)
+    profiled.enable(gs)
+    moves = gs.getAllPossibleMoveCodes()
+    assert sum(profiled.movesPerPiece.values()) == len(moves)
+
+def testAttackMethodsWrapped(profiled):
+    gs = ChessEngine.GameState.fromFEN("4k3/8/8/8/8/8/8/4K2R w K - 0 1")
+    profiled.enable(gs)
+    gs.inCheck()
+    gs.getValidMoveCodes()
+    for name in ("squareUnderAttack", "attackersTo", "getChecksAndPins"):
+        assert profiled.stats[name][0] > 0
@@ -0,0 +1,98 @@
+import os
+
+import ChessEngine
+import Tablebase
+import pytest
+
+blockEntries = 4096
+
+
+@pytest.fixture(scope = "module")
+def directory(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("tables"))
+    for signature in ("KQvK", "KRvK"):
+        Tablebase.generate(signature, directory, blockEntries)
+    return directory
+
+@pytest.fixture
+def tablebase(directory):
+    with Tablebase.Tablebase(directory) as tablebase:
+        yield tablebase
+
+def probe(tablebase, fen):
+    gs = ChessEngine.GameState.fromFEN(fen)
+    return tablebase.probeWDL(gs), tablebase.probeDTZ(gs)
+
+
+@pytest.mark.parametrize("fen, wdl, dtz", [
+    ("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1", Tablebase.WIN, 1), # Qg8 mates
+    ("k7/8/1K6/8/8/8/8/7R w - - 0 1", Tablebase.WIN, 1), # Rh8 mates
+    ("k6Q/8/1K6/8/8/8/8/8 b - - 0 1", Tablebase.LOSS, 0), # mated
+    ("k6R/8/1K6/8/8/8/8/8 b - - 0 1", Tablebase.LOSS, 0),
+    ("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1", Tablebase.DRAW, 0), # stalemate
+    ("k7/8/1K6/2Q5/8/8/8/8 w - - 0 1", Tablebase.WIN, 1), # Qc8, Qf8 or Qa7 mate
+    ("kQ6/8/1K6/8/8/8/8/8 b - - 0 1", Tablebase.DRAW, 0), # the queen hangs
+    ("8/8/8/3k4/8/8/8/K6R b - - 0 1", Tablebase.LOSS, -30),
+])
+def testKnownValues(tablebase, fen, wdl, dtz):
+    assert probe(tablebase, fen) == (wdl, dtz)
+
+@pytest.mark.parametrize("fen, flipped", [
+    ("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1", "6q1/8/8/8/8/1k6/8/K7 b - - 0 1"),
+    ("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1", "8/8/8/8/8/1k6/2q5/K7 w - - 0 1"),
+    ("8/8/8/3k4/8/8/8/K6R b - - 0 1", "k6r/8/8/8/3K4/8/8/8 w - - 0 1"),
+])
+def testFlippedColors(tablebase, fen, flipped):
+    assert probe(tablebase, flipped) == probe(tablebase, fen)
+
+# the longest wins are mate in 10 (KQvK) and mate in 16 (KRvK) moves
+@pytest.mark.parametrize("signature, longest", [("KQvK", 19), ("KRvK", 31)])
+def testLongestWin(tablebase, directory, signature, longest):
+    path = os.path.join(directory, signature + Tablebase.dtzSuffix)
+    size = Tablebase.TableLayout(signature).size
+    assert max(tablebase.value(path, index) for index in range(size)) == longest
+
+def testBestMoveMates(tablebase):
+    gs = ChessEngine.GameState.fromFEN("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1")
+    gs.makeMove(tablebase.getBestMove(gs))
+    assert not gs.getValidMoveCodes() and gs.checkMate
+
+def testWinKeepsWinning(tablebase):
+    gs = ChessEngine.GameState.fromFEN("8/8/8/3k4/8/8/8/K6R w - - 0 1")
+    for ply in range(61):
+        wdl, dtz = tablebase.probeWDL(gs), tablebase.probeDTZ(gs)
+        if not gs.getValidMoveCodes():
+            break
+        gs.makeMove(tablebase.getBestMove(gs))
+        # the winner shortens the distance, the loser cannot lengthen it
+        assert tablebase.probeWDL(gs) == -wdl
+        assert abs(tablebase.probeDTZ(gs)) == abs(dtz) - 1
+    assert gs.checkMate
+
+def testNotCovered(tablebase, monkeypatch):
+    assert probe(tablebase, "k7/8/1K6/8/8/8/8/6BB w - - 0 1") == (None, None) # no KBBvK table
+    assert probe(tablebase, "r3k3/8/8/8/8/8/8/4K2Q w q - 0 1") == (None, None) # castling rights
+    # too many pieces: answered before the signature is built
+    monkeypatch.setattr(Tablebase, "signatureOf", None)
+    assert tablebase.probeWDL(ChessEngine.GameState()) is None
+
+def testTrivialDraws(tmp_path):
+    with Tablebase.Tablebase(str(tmp_path)) as empty:
+        assert probe(empty, "k7/8/1K6/8/8/8/8/8 w - - 0 1") == (0, 0)
+        assert probe(empty, "k7/8/1K6/8/8/8/8/6N1 b - - 0 1") == (0, 0)
+        assert probe(empty, "k7/8/1K6/8/8/8/8/6Q1 w - - 0 1") == (None, None)
+
+def testBlockCache(directory):
+    path = os.path.join(directory, "KQvK" + Tablebase.wdlSuffix)
+    with Tablebase.Tablebase(directory, cacheBlocks = 2) as tablebase:
+        tablebase.value(path, 0)
+        tablebase.value(path, 1) # same block
+        assert (tablebase.hits, tablebase.misses) == (1, 1)
+        tablebase.value(path, blockEntries)
+        tablebase.value(path, 0) # block 0 becomes the most recently used
+        tablebase.value(path, 2 * blockEntries) # evicts block 1
+        assert (tablebase.hits, tablebase.misses) == (2, 3)
+        assert list(tablebase.cache) == [(path, 0), (path, 2)]
+        tablebase.value(path, blockEntries)
+        assert (tablebase.hits, tablebase.misses) == (2, 4)
+        assert len(tablebase.cache) == 2